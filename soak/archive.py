@@ -0,0 +1,97 @@
+# Copyright 2020 Andrzej Cichocki
+
+# This file is part of soak.
+#
+# soak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# soak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with soak.  If not, see <http://www.gnu.org/licenses/>.
+
+'Deterministic tar or zip bundles written as a stream.'
+from contextlib import contextmanager
+from lagoon.util import atomic
+from pathlib import Path
+import gzip, os, sys, tarfile, time, zipfile
+
+class _ViewReader:
+
+    def __init__(self, data):
+        self.view = memoryview(data)
+        self.pos = 0
+
+    def read(self, size = -1):
+        end = len(self.view) if size < 0 else self.pos + size
+        chunk = self.view[self.pos:end]
+        self.pos += len(chunk)
+        return chunk
+
+class TarBundle:
+
+    def __init__(self, f, compression, mtime):
+        if 'gz' == compression:
+            self.gzip = f = gzip.GzipFile(fileobj = f, mode = 'wb', filename = '', mtime = mtime) # Not the time and name tarfile would use.
+            compression = ''
+        else:
+            self.gzip = None
+        self.tar = tarfile.open(fileobj = f, mode = f"w|{compression}", format = tarfile.PAX_FORMAT)
+        self.mtime = mtime
+
+    def add(self, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = self.mtime
+        info.mode = 0o644
+        self.tar.addfile(info, _ViewReader(data))
+
+    def close(self):
+        self.tar.close()
+        if self.gzip is not None:
+            self.gzip.close()
+
+class ZipBundle:
+
+    def __init__(self, f, compression, mtime):
+        self.zip = zipfile.ZipFile(f, 'w', zipfile.ZIP_DEFLATED)
+        self.datetime = time.gmtime(max(mtime, 315532800))[:6] # Zip cannot go before 1980.
+
+    def add(self, name, data):
+        info = zipfile.ZipInfo(name, self.datetime)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.external_attr = 0o644 << 16
+        self.zip.writestr(info, data)
+
+    def close(self):
+        self.zip.close()
+
+suffixes = {
+    '.zip': (ZipBundle, None),
+    '.tar': (TarBundle, ''),
+    '.tgz': (TarBundle, 'gz'),
+    '.gz': (TarBundle, 'gz'),
+    '.bz2': (TarBundle, 'bz2'),
+    '.xz': (TarBundle, 'xz'),
+}
+
+@contextmanager
+def openbundle(path):
+    'Yield a bundle writing to path, or stdout if it is -, with format chosen by suffix and tar by default.'
+    cls, compression = suffixes.get(os.path.splitext(path)[1], (TarBundle, ''))
+    mtime = int(os.environ.get('SOURCE_DATE_EPOCH', 0))
+    if '-' == path:
+        bundle = cls(sys.stdout.buffer, compression, mtime)
+        yield bundle
+        bundle.close()
+        sys.stdout.buffer.flush()
+    else:
+        with atomic(Path(path)) as partpath, partpath.open('wb') as f: # No half-written bundle on failure.
+            bundle = cls(f, compression, mtime)
+            yield bundle
+            bundle.close()
@@ -0,0 +1,56 @@
+# Copyright 2020 Andrzej Cichocki
+
+# This file is part of soak.
+#
+# soak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# soak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with soak.  If not, see <http://www.gnu.org/licenses/>.
+
+'Compare the native block literal emitter with the PyYAML one.'
+from ..context import _literal, blockliteral, createparent, pyyamlblockliteral
+from argparse import ArgumentParser
+from aridity.model import Text
+import random, time
+
+def _texts(n, lines, seed):
+    r = random.Random(seed)
+    words = ['image', 'tag:', 'latest', '-', '#', '{{ .Values }}', 'port', '8080']
+    return [''.join(f"{' ' * r.choice([0, 0, 2, 4])}{' '.join(r.choices(words, k = r.randint(1, 6)))}\n" for _ in range(lines)) for _ in range(n)]
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('-n', type = int, default = 500)
+    parser.add_argument('--lines', type = int, default = 20)
+    parser.add_argument('--repeat', type = int, default = 3)
+    config = parser.parse_args()
+    scope = (-createparent('.')).scope().createchild()
+    scope['indent',] = Text('  ')
+    texts = _texts(config.n, config.lines, 0)
+    indentunitfactory = lambda: scope.resolved('indentunit').cat()
+    def native():
+        for text in texts:
+            blockliteral(scope, Text(text))
+    def pyyaml():
+        for text in texts:
+            pyyamlblockliteral('  ', text, indentunitfactory)
+    def once(f):
+        start = time.perf_counter()
+        f()
+        return time.perf_counter() - start
+    for name, f in ['pyyaml', pyyaml], ['native', native]:
+        _literal.cache_clear()
+        cold = once(f)
+        t = min(once(f) for _ in range(config.repeat))
+        print(f"{name}: {cold / config.n * 1e6:.0f}us/literal cold, {t / config.n * 1e6:.0f}us/literal warm")
+
+if '__main__' == __name__:
+    main()
@@ -0,0 +1,43 @@
+# Copyright 2020 Andrzej Cichocki
+
+# This file is part of soak.
+#
+# soak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# soak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with soak.  If not, see <http://www.gnu.org/licenses/>.
+
+'Compare fork-per-task with the worker pool over many trivial tasks.'
+from ..multifork import Tasks
+from argparse import ArgumentParser
+import os, time
+
+def _task():
+    pass
+
+def _drain(n, limit, **kwargs):
+    tasks = Tasks(_task for _ in range(n))
+    start = time.perf_counter()
+    tasks.drain(limit, **kwargs)
+    return time.perf_counter() - start
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('-n', type = int, default = 2000)
+    parser.add_argument('-j', type = int, default = os.cpu_count())
+    parser.add_argument('--repeat', type = int, default = 3)
+    config = parser.parse_args()
+    for name, kwargs in ['fork', {}], ['pool', dict(pool = True)]:
+        t = min(_drain(config.n, config.j, **kwargs) for _ in range(config.repeat))
+        print(f"{name}: {t:.3f}s for {config.n} tasks ({t / config.n * 1e6:.0f}us/task)")
+
+if '__main__' == __name__:
+    main()
@@ -0,0 +1,131 @@
+# Copyright 2020 Andrzej Cichocki
+
+# This file is part of soak.
+#
+# soak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# soak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with soak.  If not, see <http://www.gnu.org/licenses/>.
+
+'Time each phase of soak over a generated tree, optionally against a stored baseline.'
+from ..context import createparent
+from ..discovery import Discovery
+from ..multifork import Tasks
+from ..parsecache import ParseCache
+from ..soak import SoakConfig
+from .tree import generate
+from argparse import ArgumentParser
+from functools import partial
+from lagoon import git
+from pathlib import Path
+from tempfile import TemporaryDirectory
+import json, os, shutil, sys, time
+
+class Phases:
+
+    def __init__(self, root, limit, pool):
+        self.root = root
+        self.limit = limit
+        self.pool = pool
+        self.parent = createparent(root)
+        self.parsecache = ParseCache(root)
+        self.discovery = Discovery(root, SoakConfig.filename)
+
+    def _drain(self, method):
+        tasks = Tasks(partial(getattr(c, method), t) for c in self.soakconfigs for t in c.reltargets)
+        tasks.drain(self.limit, self.pool)
+
+    def _load(self):
+        self.soakconfigs = [SoakConfig(self.parent, p, self.parsecache) for p in self.configpaths]
+
+    def discovery_git(self):
+        self.configpaths = self.discovery()
+
+    def discovery_walk(self):
+        self.discovery(False)
+
+    def parse(self):
+        shutil.rmtree(self.parsecache.dirpath, ignore_errors = True)
+        self.parsecache.warm(self.configpaths, self.limit, self.pool)
+        self._load()
+
+    def load(self):
+        self._load()
+
+    def drain(self):
+        self._drain('process')
+
+    def diff(self):
+        self._drain('diff')
+
+    def check(self):
+        self._drain('check')
+
+    names = ['discovery_git', 'discovery_walk', 'parse', 'load', 'drain', 'diff', 'check'] # Each may depend on the previous.
+
+    def __call__(self, repeat):
+        self.discovery(False) # Warm the mtime cache.
+        times = {}
+        for name in self.names:
+            f = getattr(self, name)
+            def once():
+                start = time.perf_counter()
+                f()
+                return time.perf_counter() - start
+            times[name] = min(once() for _ in range(repeat))
+        return times
+
+def main():
+    parser = ArgumentParser()
+    parser.add_argument('--configs', type = int, default = 20)
+    parser.add_argument('--targets', type = int, default = 10)
+    parser.add_argument('--lines', type = int, default = 50)
+    parser.add_argument('--blocks', type = float, default = .25)
+    parser.add_argument('--resultsize', type = int, default = 400)
+    parser.add_argument('-j', type = int, default = os.cpu_count())
+    parser.add_argument('--pool', action = 'store_true')
+    parser.add_argument('--repeat', type = int, default = 3)
+    parser.add_argument('--save')
+    parser.add_argument('--baseline')
+    parser.add_argument('--tolerance', type = float, default = .2)
+    config = parser.parse_args()
+    shape = {k: getattr(config, k) for k in ['configs', 'targets', 'lines', 'blocks', 'resultsize', 'j', 'pool']}
+    with TemporaryDirectory() as tempdir:
+        root = Path(tempdir, 'tree')
+        generate(root, config.configs, config.targets, config.lines, config.blocks, config.resultsize)
+        git.init._q[print](root)
+        times = Phases(root, config.j, config.pool)(config.repeat)
+    if config.baseline is None:
+        baseline = {}
+    else:
+        with open(config.baseline) as f:
+            baseline = json.load(f)
+        if baseline['shape'] != shape:
+            print(f"Baseline shape differs: {baseline['shape']}", file = sys.stderr)
+        baseline = baseline['times']
+    regressions = []
+    for name, t in times.items():
+        try:
+            ratio = t / baseline[name]
+        except KeyError:
+            print(f"{name}: {t:.3f}s")
+            continue
+        print(f"{name}: {t:.3f}s ({ratio:.2f}x baseline {baseline[name]:.3f}s)")
+        if ratio > 1 + config.tolerance:
+            regressions.append(name)
+    if config.save is not None:
+        with open(config.save, 'w') as f:
+            json.dump(dict(shape = shape, times = times), f, indent = 4, sort_keys = True)
+    if regressions:
+        sys.exit(f"Regressed: {', '.join(regressions)}")
+
+if '__main__' == __name__:
+    main()
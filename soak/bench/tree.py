@@ -0,0 +1,40 @@
+# Copyright 2020 Andrzej Cichocki
+
+# This file is part of soak.
+#
+# soak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# soak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with soak.  If not, see <http://www.gnu.org/licenses/>.
+
+'Generate synthetic soak trees of configurable shape.'
+from pathlib import Path
+from random import Random
+
+def generate(root, configs, targets, lines = 20, blocks = .25, resultsize = 80, seed = 0):
+    'Write soak.arid files each with YAML targets from a shared template of the given lines, about blocks of which interpolate a block literal of roughly resultsize bytes.'
+    r = Random(seed)
+    root = Path(root)
+    for c in range(configs):
+        dirpath = root / f"c{c // 100:03d}" / f"c{c:05d}"
+        dirpath.mkdir(parents = True)
+        template = ['root:']
+        for l in range(lines):
+            if r.random() < blocks:
+                template.append(f"    block{l}: $|$(payload)")
+            else:
+                template.append(f"    key{l}: $(n)-{l}")
+        (dirpath / 'bench.yaml.aridt').write_text('\n'.join(template) + '\n')
+        payload = '\n'.join(f"{i:07d} {'x' * 71}" for i in range(max(1, resultsize // 80)))
+        config = [f"payload = $.({payload}\n)", 'soak']
+        for t in range(targets):
+            config.extend([f"    t{t}.yaml", '        from = bench.yaml.aridt', f"        n = {c}.{t}", '        diff = $(data)'])
+        (dirpath / 'soak.arid').write_text('\n'.join(config) + '\n')
@@ -17,10 +17,15 @@
 
 from aridity.model import Binary
 from pathlib import Path
+from soak.util import artifact
 import subprocess, sys
 
+def _projectdir(scope, resolvable):
+    return Path(scope.resolved('cwd').cat(), resolvable.resolve(scope).cat())
+
+@artifact(lambda *args: [_projectdir(*args)])
 def bdist_wheel(scope, resolvable):
-    projectdir = Path(scope.resolved('cwd').cat(), resolvable.resolve(scope).cat())
+    projectdir = _projectdir(scope, resolvable)
     subprocess.check_call([sys.executable, 'setup.py', 'bdist_wheel'], cwd = projectdir, stdout = subprocess.DEVNULL)
     # TODO LATER: Instead of reading the file, add a type representing a path and return that.
     whlpath, = (projectdir / 'dist').glob('*.whl')
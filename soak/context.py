@@ -15,11 +15,12 @@
 # You should have received a copy of the GNU General Public License
 # along with soak.  If not, see <http://www.gnu.org/licenses/>.
 
-from .util import PathResolvable, Snapshot
+from .util import PathResolvable, SharedSnapshot
 from aridity import NoSuchPathException
 from aridity.config import ConfigCtrl
 from aridity.model import Function, Text
 from aridity.scope import slashfunction
+from functools import lru_cache
 from lagoon import git
 from lagoon.program import ONELINE
 import re, subprocess, yaml
@@ -28,23 +29,49 @@ singledigit = re.compile('[0-9]')
 zeroormorespaces = re.compile(' *')
 linefeed = '\n'
 toplevelres = PathResolvable('toplevel')
+blockunsafe = re.compile('[^\n -~]| \n') # PyYAML only uses a block literal for printable ASCII with no space before a line break.
 
-def blockliteral(scope, textresolvable):
-    contextindent = scope.resolved('indent').cat()
-    text = yaml.dump(textresolvable.resolve(scope).cat(), default_style = '|')
+def pyyamlblockliteral(contextindent, text, indentunitfactory):
+    text = yaml.dump(text, default_style = '|')
     header, *lines = text.splitlines() # For template interpolation convenience we discard the (insignificant) trailing newline.
     if not lines:
-        return Text(header)
+        return header
     if '...' == lines[-1]:
         lines.pop() # XXX: Could this result in no remaining lines?
-    indentunit = scope.resolved('indentunit').cat()
+    indentunit = indentunitfactory()
     m = singledigit.search(header)
     if m is None:
         pyyamlindent = len(zeroormorespaces.match(lines[0]).group())
     else:
         pyyamlindent = int(m.group())
         header = f"{header[:m.start()]}{len(zeroormorespaces.fullmatch(indentunit).group())}{header[m.end():]}"
-    return Text(f"""{header}\n{linefeed.join(f"{contextindent}{indentunit}{line[pyyamlindent:]}" for line in lines)}""")
+    return f"""{header}\n{linefeed.join(f"{contextindent}{indentunit}{line[pyyamlindent:]}" for line in lines)}"""
+
+@lru_cache(0x1000)
+def _literal(text):
+    'Whether PyYAML would need an indentation indicator, its chomping indicator, and the lines, or None if it would not emit a block literal.'
+    if not text or ' ' == text[-1] or blockunsafe.search(text) is not None:
+        return
+    lines = text.split(linefeed)
+    if lines[-1]:
+        chomp = '-'
+    else:
+        lines.pop()
+        chomp = '+' if not lines[-1] else ''
+    return text[0] in ' \n', chomp, lines
+
+def blockliteral(scope, textresolvable):
+    contextindent = scope.resolved('indent').cat()
+    text = textresolvable.resolve(scope).cat()
+    literal = _literal(text)
+    indentunitfactory = lambda: scope.resolved('indentunit').cat()
+    if literal is None:
+        return Text(pyyamlblockliteral(contextindent, text, indentunitfactory))
+    indicated, chomp, lines = literal
+    indentunit = indentunitfactory()
+    header = f"|{len(zeroormorespaces.fullmatch(indentunit).group())}{chomp}" if indicated else f"|{chomp}"
+    prefix = f"\n{contextindent}{indentunit}"
+    return Text(f"{header}{prefix}{prefix.join(lines)}")
 
 def rootpath(scope, *resolvables):
     return slashfunction(scope, toplevelres, *resolvables)
@@ -60,7 +87,7 @@ def createparent(soakroot):
     s = (-parent).scope()
     s['|',] = Function(blockliteral)
     s['//',] = Function(rootpath)
-    s['toplevel',] = Snapshot(lambda: _toplevel(soakroot))
+    s['toplevel',] = SharedSnapshot(lambda: _toplevel(soakroot))
     (-parent).execute('data = $processtemplate$(from)') # XXX: Too easy to accidentally override?
     parent.indentunit = 4 * ' '
     return parent
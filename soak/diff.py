@@ -0,0 +1,59 @@
+# Copyright 2020 Andrzej Cichocki
+
+# This file is part of soak.
+#
+# soak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# soak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with soak.  If not, see <http://www.gnu.org/licenses/>.
+
+from .state import samecontent
+from difflib import unified_diff
+import locale
+
+header, hunk, deletion, addition = (f"\x1b[{n}m" for n in [1, 36, 31, 32]) # Same defaults as GNU diff.
+reset = '\x1b[m'
+noeol = '\\ No newline at end of file\n'
+
+def _colour(lines):
+    for i, line in enumerate(lines):
+        if not line.endswith('\n'):
+            line += f"\n{noeol}"
+        if i < 2:
+            colour = header
+        elif line.startswith('@@'):
+            colour = hunk
+        elif line.startswith('-'):
+            colour = deletion
+        elif line.startswith('+'):
+            colour = addition
+        else:
+            yield line
+            continue
+        text, eol = line.split('\n', 1)
+        yield f"{colour}{text}{reset}\n{eol}"
+
+def _lines(text):
+    'Like splitlines with keepends, but only breaking at line feeds.'
+    *lines, last = text.split('\n')
+    return [f"{l}\n" for l in lines] + ([last] if last else [])
+
+def textdiff(fromtext, topath, fromlabel = '-'):
+    'Return the coloured unified diff from the given text to the given file, or the empty string if they are the same.'
+    encoding = locale.getpreferredencoding(False) # Same as writeout.
+    if samecontent(fromtext.encode(encoding), topath):
+        return ''
+    try:
+        with open(topath, encoding = encoding, errors = 'replace', newline = '') as f:
+            totext = f.read()
+    except FileNotFoundError:
+        totext = ''
+    return ''.join(_colour(unified_diff(_lines(fromtext), _lines(totext), fromlabel, str(topath))))
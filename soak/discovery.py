@@ -0,0 +1,153 @@
+# Copyright 2020 Andrzej Cichocki
+
+# This file is part of soak.
+#
+# soak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# soak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with soak.  If not, see <http://www.gnu.org/licenses/>.
+
+from .state import cachedirname
+from fnmatch import fnmatchcase
+from lagoon import git
+from lagoon.program import ONELINE
+from lagoon.util import atomic
+from pathlib import Path
+from subprocess import CalledProcessError, DEVNULL
+import json, logging, os
+
+log = logging.getLogger(__name__)
+defaultprune = frozenset([cachedirname, '.git', '.hg', '.svn', '.tox', '.venv', '__pycache__', 'node_modules'])
+
+class Discovery:
+    'Find config files under the root, preferring git ls-files and otherwise walking with a cache keyed on directory mtimes.'
+
+    def __init__(self, soakroot, filename, prune = defaultprune):
+        self.soakroot = soakroot
+        self.filename = filename
+        self.prune = prune
+        self.path = soakroot / cachedirname / 'discovery.json'
+
+    def _gitpaths(self):
+        try:
+            text = git.ls_files._z.__cached.__others.__exclude_standard('--', f":(glob)**/{self.filename}", cwd = self.soakroot, stderr = DEVNULL)
+        except CalledProcessError:
+            return
+        return [p for p in (self.soakroot / q for q in text.split('\0') if q) if not self.prune.intersection(p.parts[:-1]) and p.is_file()]
+
+    def _load(self):
+        try:
+            with self.path.open() as f:
+                return json.load(f)['dirs']
+        except FileNotFoundError:
+            return {}
+        except (KeyError, ValueError) as e:
+            log.warning("Ignoring unreadable discovery cache: %s", e)
+            return {}
+
+    def _gitdirs(self):
+        try:
+            text = git.ls_files._z.__cached.__others.__exclude_standard.__directory(cwd = self.soakroot, stderr = DEVNULL)
+        except CalledProcessError:
+            return
+        reldirs = {Path()}
+        for q in text.split('\0'):
+            if q.endswith('/'): # Untracked, so what is under it is not listed.
+                for dirpath, dirnames, _ in os.walk(self.soakroot / q):
+                    dirnames[:] = [n for n in dirnames if n not in self.prune]
+                    reldirs.add(Path(dirpath).relative_to(self.soakroot))
+            elif q:
+                reldirs.update(Path(q).parents)
+        return [self.soakroot / d for d in reldirs if self.prune.isdisjoint(d.parts)]
+
+    def _walk(self):
+        'Map each unpruned dir relative to the root to its mtime, subdirs and whether it has the file, updating the cache.'
+        olddirs = self._load()
+        newdirs = {}
+        stack = ['']
+        while stack:
+            reldir = stack.pop()
+            dirpath = os.path.join(self.soakroot, reldir)
+            mtime = os.stat(dirpath).st_mtime_ns
+            try:
+                oldmtime, subdirs, found = olddirs[reldir]
+            except KeyError:
+                oldmtime = None
+            if mtime != oldmtime:
+                subdirs = []
+                found = False
+                with os.scandir(dirpath) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks = False):
+                            subdirs.append(entry.name) # Pruned on use so that the cache does not depend on prune.
+                        elif self.filename == entry.name:
+                            found = True
+            newdirs[reldir] = mtime, subdirs, found
+            stack.extend(os.path.join(reldir, name) for name in subdirs if name not in self.prune)
+        if newdirs != {k: tuple(v) for k, v in olddirs.items()}:
+            with atomic(self.path) as partpath, partpath.open('w') as f:
+                json.dump(dict(dirs = newdirs), f, separators = (',', ':'), sort_keys = True)
+        return newdirs
+
+    def _walkpaths(self):
+        return [Path(self.soakroot, reldir, self.filename) for reldir, (_, _, found) in self._walk().items() if found]
+
+    def dirs(self, usegit = True):
+        'Unpruned dirs under the root, where with git those holding only ignored files are also pruned.'
+        dirs = self._gitdirs() if usegit else None
+        if dirs is None:
+            dirs = [Path(self.soakroot, reldir) for reldir in self._walk()]
+        return sorted(dirs)
+
+    def __call__(self, usegit = True):
+        paths = self._gitpaths() if usegit else None
+        if paths is None:
+            paths = self._walkpaths()
+        return sorted(paths)
+
+def gitchanges(soakroot, rev):
+    'Absolute paths that differ in the work tree from rev, including untracked ones and both sides of renames.'
+    toplevel = git.rev_parse.__show_toplevel[ONELINE](cwd = soakroot)
+    names = git.diff._z.__name_only.__no_renames(rev, '--', cwd = toplevel).split('\0')
+    names += git.ls_files._z.__others.__exclude_standard(cwd = toplevel).split('\0')
+    return {os.path.join(toplevel, name) for name in names if name}
+
+def _match(parts, pattern):
+    if not pattern:
+        return not parts
+    if '**' == pattern[0]:
+        return any(_match(parts[i:], pattern[1:]) for i in range(len(parts) + 1))
+    return bool(parts) and fnmatchcase(parts[0], pattern[0]) and _match(parts[1:], pattern[1:])
+
+def _under(parts, pattern):
+    if not parts:
+        return bool(pattern)
+    if not pattern:
+        return False
+    if '**' == pattern[0]:
+        return True
+    return fnmatchcase(parts[0], pattern[0]) and _under(parts[1:], pattern[1:])
+
+class Selection:
+    'Paths or globs relative to the root, where * stays within a component and ** spans any number of them.'
+
+    def __init__(self, patterns):
+        self.patterns = [Path(os.path.normpath(p)).parts for p in patterns]
+
+    def __call__(self, relpath):
+        'Whether relpath is selected.'
+        parts = Path(relpath).parts
+        return any(_match(parts, p) for p in self.patterns)
+
+    def under(self, reldir):
+        'Whether anything strictly under reldir could be selected.'
+        parts = Path(reldir).parts
+        return any(_under(parts, p) for p in self.patterns)
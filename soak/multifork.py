@@ -15,11 +15,171 @@
 # You should have received a copy of the GNU General Public License
 # along with soak.  If not, see <http://www.gnu.org/licenses/>.
 
-from base64 import b64decode, b64encode
+from .trace import tracer
+from collections import deque, namedtuple
+from contextlib import contextmanager
 from diapyr.util import invokeall
-from select import select
+from functools import partial
+from io import BytesIO
+from mmap import ACCESS_COPY, mmap
+from queue import Empty, SimpleQueue
+from selectors import DefaultSelector, EVENT_READ
 from tblib import Traceback
-import os, pickle, sys
+from tempfile import TemporaryFile
+import gc, os, pickle, resource, signal, socket, struct, sys, threading, time
+
+bufsize = 0x10000
+ack = None
+
+def _exit(code):
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(code) # Do not unwind into the parent's stack.
+
+def _run(task):
+    try:
+        return 0, GoodResult(task())
+    except BaseException as e:
+        return 1, BadResult(e)
+
+class Usage(namedtuple('BaseUsage', 'wall utime stime maxrss')):
+    'Wall and CPU seconds, and peak RSS in bytes.'
+
+    @classmethod
+    def of(cls, wall, rusage):
+        return cls(wall, rusage.ru_utime, rusage.ru_stime, rusage.ru_maxrss * 1024) # Linux reports KiB.
+
+    @property
+    def cpu(self):
+        return self.utime + self.stime
+
+    def __str__(self):
+        return f"{self.wall:.2f}s wall {self.cpu:.2f}s cpu {self.maxrss / 0x100000:.0f}MiB"
+
+def _rusage():
+    'Like what wait4 would report for this process so far, where maxrss is the peak of the whole worker.'
+    us, ch = (resource.getrusage(who) for who in [resource.RUSAGE_SELF, resource.RUSAGE_CHILDREN])
+    return Usage(None, us.ru_utime + ch.ru_utime, us.ru_stime + ch.ru_stime, max(us.ru_maxrss, ch.ru_maxrss) * 1024)
+
+def _exitcode(status):
+    return -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+
+def _sharedfd():
+    try:
+        return os.memfd_create('soak')
+    except AttributeError:
+        with TemporaryFile() as f:
+            return os.dup(f.fileno())
+
+class _Pickler(pickle.Pickler):
+
+    def __init__(self, f, blobs):
+        super().__init__(f, 5)
+        self.blobs = blobs
+        self.offset = 0
+
+    def persistent_id(self, obj):
+        if type(obj) in {bytes, bytearray} and len(obj) >= Channel.threshold:
+            self.blobs.append(obj)
+            pid = self.offset, len(obj), bytearray is type(obj)
+            self.offset += len(obj)
+            return pid
+
+class _Unpickler(pickle.Unpickler):
+
+    def __init__(self, f, view):
+        super().__init__(f)
+        self.view = view
+
+    def persistent_load(self, pid):
+        offset, size, mutable = pid
+        view = self.view[offset:offset + size] # Keeps the mapping alive, so nothing is copied.
+        return view if mutable else view.toreadonly()
+
+class Channel:
+    'Framed pickles over a socket, with large bytes objects passed in a shared memory fd and received as memoryviews of it, read-only unless they were bytearrays.'
+
+    header = struct.Struct('<QQ')
+    threshold = 0x10000
+    maxfds = 16
+
+    @classmethod
+    def pair(cls):
+        return map(cls, socket.socketpair())
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.buffer = bytearray()
+        self.fds = deque()
+        self.received = deque()
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def send(self, obj):
+        blobs = []
+        f = BytesIO()
+        pickler = _Pickler(f, blobs)
+        pickler.dump(obj)
+        payload = f.getbuffer()
+        header = self.header.pack(len(payload), pickler.offset)
+        if blobs:
+            fd = _sharedfd()
+            try:
+                with os.fdopen(fd, 'wb', closefd = False) as g:
+                    for blob in blobs:
+                        g.write(blob)
+                socket.send_fds(self.sock, [header], [fd])
+            finally:
+                os.close(fd)
+            self.sock.sendall(payload)
+        else:
+            self.sock.sendall(header + payload)
+
+    def pump(self):
+        data, fds, _, _ = socket.recv_fds(self.sock, bufsize, self.maxfds)
+        self.fds.extend(fds)
+        if not data:
+            return False
+        self.buffer += data
+        while len(self.buffer) >= self.header.size:
+            size, sharedsize = self.header.unpack_from(self.buffer)
+            end = self.header.size + size
+            if len(self.buffer) < end:
+                break
+            with memoryview(self.buffer) as v:
+                f = BytesIO(v[self.header.size:end])
+            if sharedsize:
+                fd = self.fds.popleft()
+                try:
+                    m = mmap(fd, sharedsize, access = ACCESS_COPY) # Private, so writing to a view does not reach the fd.
+                finally:
+                    os.close(fd)
+                self.received.append(_Unpickler(f, memoryview(m)).load()) # Unmapped once the views are gone.
+            else:
+                self.received.append(pickle.load(f))
+            del self.buffer[:end]
+        return True
+
+    def poll(self):
+        'Receive everything available without blocking, and return False at EOF.'
+        try:
+            while self.pump():
+                pass
+        except BlockingIOError:
+            return True
+        return False
+
+    def get(self):
+        while not self.received:
+            if not self.pump():
+                raise EOFError
+        return self.received.popleft()
+
+    def close(self):
+        while self.fds:
+            os.close(self.fds.popleft())
+        self.sock.close()
 
 class GoodResult:
 
@@ -55,78 +215,539 @@ class BadResult:
     def get(self):
         raise self.exception
 
-class Job:
+class Lines:
 
-    ttl = 3
+    def __init__(self):
+        self.buffer = b''
 
-    def __init__(self, index, task):
-        self.index = index
-        self.task = task
+    @staticmethod
+    def _universal(data):
+        return data.replace(b'\r\n', b'\n').replace(b'\r', b'\n')
 
-    def start(self):
+    def feed(self, data):
+        data = self.buffer + data
+        cr = data.endswith(b'\r') # May be followed by its LF in the next read.
+        *lines, rest = self._universal(data[:-1] if cr else data).split(b'\n')
+        self.buffer = rest + b'\r' if cr else rest
+        return [l + b'\n' for l in lines]
+
+    def rest(self):
+        data, self.buffer = self._universal(self.buffer), b''
+        return [data] if data else []
+
+class Child:
+
+    def _fork(self):
         r1, w1 = os.pipe()
         r2, w2 = os.pipe()
-        rx, wx = os.pipe()
+        self.channel, childchannel = Channel.pair()
         pid = os.fork()
         if pid:
             os.close(w1)
             os.close(w2)
-            os.close(wx)
+            childchannel.close()
             self.pid = pid
-            return map(os.fdopen, [r1, r2, rx])
+            self.stdoutfd = r1
+            self.outputs = {r1: Lines(), r2: Lines()}
+            for r in self.outputs:
+                os.set_blocking(r, False)
+            self.channel.sock.setblocking(False)
+            return
         os.close(r1)
         os.close(r2)
-        os.close(rx)
+        self.channel.close()
         os.dup2(w1, 1)
         os.close(w1)
         os.dup2(w2, 2)
         os.close(w2)
+        tracer.take() # Those are the parent's.
+        return childchannel
+
+    def read(self, r):
+        'Return the complete lines now available from the given output, or None at EOF.'
         try:
-            obj = GoodResult(self.task())
-            code = 0
-        except BaseException as e:
-            obj = BadResult(e)
-            code = 1
-        os.write(wx, b64encode(pickle.dumps([self.index, obj])))
-        sys.exit(code)
-
-    def decr(self):
-        self.ttl = ttl = self.ttl - 1
-        if not ttl:
-            s = os.waitpid(self.pid, 0)[1]
-            return -os.WTERMSIG(s) if os.WIFSIGNALED(s) else os.WEXITSTATUS(s)
+            data = os.read(r, bufsize)
+        except BlockingIOError:
+            return []
+        return self.outputs[r].feed(data) if data else None
+
+    def flush(self):
+        'Yield every output with all its remaining lines, for when the writer has finished.'
+        for r, lines in self.outputs.items():
+            v = []
+            while True:
+                l = self.read(r)
+                if not l:
+                    break
+                v.extend(l)
+            v.extend(lines.rest())
+            yield r, v
+
+class Job(Child):
+
+    def __init__(self, index, task):
+        self.index = index
+        self.task = task
+
+    def start(self):
+        childchannel = self._fork()
+        if childchannel is None:
+            return
+        with tracer.span('task', index = self.index):
+            code, obj = _run(self.task)
+        childchannel.send([self.index, obj, None, tracer.take()]) # The parent measures us when reaping.
+        _exit(code)
+
+class Worker(Child):
+
+    control = None
+
+    def __init__(self, tasks):
+        self.tasks = tasks
+        self.chunk = []
+
+    def start(self, workers):
+        self.control, childcontrol = Channel.pair()
+        childchannel = self._fork()
+        if childchannel is None:
+            childcontrol.close()
+            return
+        for w in workers:
+            if w is not self:
+                w.stop() # Otherwise that worker would not see EOF until we exit.
+        self.control.close()
+        try:
+            while True:
+                for n, index in enumerate(childcontrol.get()):
+                    if n:
+                        childcontrol.get() # Wait until our output for the previous task has been collected.
+                    start = time.perf_counter()
+                    before = _rusage()
+                    with tracer.span('task', index = index):
+                        obj = _run(self.tasks[index])[1]
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+                    after = _rusage()
+                    childchannel.send([index, obj, Usage(time.perf_counter() - start, after.utime - before.utime, after.stime - before.stime, after.maxrss), tracer.take()])
+        except EOFError:
+            pass
+        _exit(0)
+
+    def send(self, chunk):
+        self.chunk[:] = chunk
+        self.index = chunk[0]
+        self.control.send(chunk)
+
+    def next(self):
+        del self.chunk[0]
+        if self.chunk:
+            self.index = self.chunk[0]
+            self.control.send(ack)
+            return True
+
+    def stop(self):
+        if self.control is not None:
+            self.control.close()
+
+class Reaper:
+    'Call back when a child exits, via its pidfd or failing that SIGCHLD.'
+
+    wakeup = None
+
+    def __init__(self, selector):
+        self.selector = selector
+        self.callbacks = {}
+
+    def __enter__(self):
+        return self
+
+    def watch(self, pid, callback):
+        try:
+            fd = os.pidfd_open(pid)
+        except (AttributeError, OSError):
+            self._installwakeup()
+            self.callbacks[pid] = callback
+            os.write(self.wakeup[1], b'\0') # It may have exited before our handler was installed.
+        else:
+            self.selector.register(fd, EVENT_READ, partial(self._pidfd, fd, pid, callback))
+
+    def _pidfd(self, fd, pid, callback):
+        self.selector.unregister(fd)
+        os.close(fd)
+        _, status, rusage = os.wait4(pid, 0)
+        callback(_exitcode(status), rusage)
+
+    def _installwakeup(self):
+        if self.wakeup is None:
+            self.wakeup = r, w = os.pipe()
+            for fd in r, w:
+                os.set_blocking(fd, False)
+            self.oldhandler = signal.signal(signal.SIGCHLD, lambda *args: None)
+            self.oldwakeupfd = signal.set_wakeup_fd(w)
+            self.selector.register(r, EVENT_READ, self._drainwakeup)
+
+    def _drainwakeup(self):
+        try:
+            while os.read(self.wakeup[0], bufsize):
+                pass
+        except BlockingIOError:
+            pass
+        self._poll()
+
+    def _poll(self):
+        for pid, callback in list(self.callbacks.items()):
+            p, status, rusage = os.wait4(pid, os.WNOHANG)
+            if p:
+                del self.callbacks[pid]
+                callback(_exitcode(status), rusage)
+
+    def __exit__(self, *exc_info):
+        if self.wakeup is not None:
+            signal.set_wakeup_fd(self.oldwakeupfd)
+            signal.signal(signal.SIGCHLD, self.oldhandler)
+            self.selector.unregister(self.wakeup[0])
+            for fd in self.wakeup:
+                os.close(fd)
+
+class _Drain:
+
+    loadinterval = 1
+
+    def __init__(self, hooks, tasks, selector, reaper, maxload, membudget):
+        self.hooks = hooks
+        self.tasks = tasks
+        self.selector = selector
+        self.reaper = reaper
+        self.maxload = maxload
+        self.membudget = membudget
+        self.results = [None] * len(tasks)
+        self.running = 0
+        self.pending = deque(sorted(range(len(tasks)), key = lambda i: -hooks.cost(tasks[i])))
+        self.reserved = {}
+
+    def _admit(self, busy):
+        'Whether the next pending task may start, given how many are already busy and the load and memory limits.'
+        if not (busy and self.pending):
+            return True
+        if self.maxload is not None and os.getloadavg()[0] >= self.maxload:
+            return False
+        return self.membudget is None or sum(self.reserved.values()) + self.hooks.memory(self.tasks[self.pending[0]]) <= self.membudget
+
+    def _started(self, index):
+        self.reserved[index] = self.hooks.memory(self.tasks[index])
+        self.hooks.started(self.tasks[index])
+
+    def _died(self, index, code):
+        'Fail a task whose process exited without reporting a result.'
+        if self.results[index] is None:
+            obj = BadResult(ChildProcessError(f"Exited with code {code} before reporting a result."))
+            self.results[index] = obj.get
+            self.hooks.reported(self.tasks[index], obj)
+
+    def _stopped(self, index, code, usage):
+        self.reserved.pop(index, None)
+        task = self.tasks[index]
+        if usage is not None:
+            self.hooks.measured(task, usage)
+        self.hooks.stopped(task, code)
+
+    def _emit(self, child, r, lines):
+        if lines:
+            callback = self.hooks.stdout if r == child.stdoutfd else self.hooks.stderr
+            task = self.tasks[child.index]
+            for line in lines:
+                callback(task, line.decode(errors = 'replace'))
+
+    def _output(self, child, r):
+        lines = child.read(r)
+        if lines is None:
+            self._emit(child, r, child.outputs[r].rest())
+            self.selector.unregister(r)
+        else:
+            self._emit(child, r, lines)
+
+    def _channel(self, child):
+        if not child.channel.poll():
+            self.selector.unregister(child.channel)
+        while child.channel.received:
+            index, obj, usage, events = child.channel.received.popleft()
+            tracer.events.extend(events)
+            self.results[index] = obj.get
+            self.hooks.reported(self.tasks[index], obj)
+            self._result(child, index, obj, usage)
+
+    def _result(self, child, index, obj, usage):
+        pass
+
+    def _watch(self, child):
+        for r in child.outputs:
+            self.selector.register(r, EVENT_READ, partial(self._output, child, r))
+        self.selector.register(child.channel, EVENT_READ, partial(self._channel, child))
+        self.running += 1
+        self.reaper.watch(child.pid, partial(self._reaped, child))
+
+    def _reaped(self, child, code, rusage):
+        'Everything the child wrote is already buffered, so collect it before reporting the exit.'
+        for r, lines in child.flush():
+            self._emit(child, r, lines)
+        if child.channel in self.selector.get_map():
+            self._channel(child)
+        for f in [*child.outputs, child.channel]:
+            if f in self.selector.get_map():
+                self.selector.unregister(f)
+        for r in child.outputs:
+            os.close(r)
+        child.channel.close()
+        self.running -= 1
+        self._exited(child, code, rusage)
+
+    def _poll(self, held = False):
+        timeout = self.hooks.tickinterval
+        if held:
+            timeout = self.loadinterval if timeout is None else min(timeout, self.loadinterval)
+        m = self.selector.get_map()
+        for key, _ in self.selector.select(timeout):
+            if m.get(key.fd) is key: # Not closed by an earlier callback.
+                key.data()
+        self.hooks.tick()
+
+class _ForkDrain(_Drain):
+
+    def __call__(self, limit):
+        while self.pending or self.running:
+            while self.pending and self.running < limit and self._admit(self.running):
+                index = self.pending.popleft()
+                job = Job(index, self.tasks[index])
+                job.startedat = time.perf_counter()
+                with tracer.span('fork', index = index):
+                    job.start()
+                self._watch(job)
+                self._started(index)
+            self._poll(bool(self.pending) and self.running < limit)
+
+    def _exited(self, job, code, rusage):
+        self._died(job.index, code)
+        self._stopped(job.index, code, Usage.of(time.perf_counter() - job.startedat, rusage))
+
+class _PoolDrain(_Drain):
+
+    def __call__(self, limit, chunksize):
+        if chunksize is None:
+            chunksize = max(1, len(self.tasks) // (limit * 4))
+        self.chunksize = chunksize
+        self.idle = deque()
+        self.workers = [Worker(self.tasks) for _ in range(min(limit, len(self.tasks)))]
+        for worker in self.workers:
+            self._start(worker)
+        while self.running:
+            while self.idle and self._admit(self._busy()):
+                self._dispatch(self.idle.popleft())
+            self._poll(bool(self.idle))
+
+    def _busy(self):
+        return sum(1 for w in self.workers if w.chunk)
+
+    def _start(self, worker):
+        with tracer.span('fork'):
+            worker.start(self.workers)
+        self._watch(worker)
+        self._dispatch(worker)
+
+    def _dispatch(self, worker):
+        if not self.pending:
+            worker.stop()
+        elif self._admit(self._busy()):
+            chunk = [self.pending.popleft()]
+            while len(chunk) < self.chunksize and self.pending:
+                chunk.append(self.pending.pop()) # Fill up with the cheapest so that costly tasks are spread over workers.
+            worker.send(chunk)
+            self._started(worker.index)
+        else:
+            self.idle.append(worker)
+
+    def _result(self, worker, index, obj, usage):
+        for r, lines in worker.flush():
+            self._emit(worker, r, lines)
+        self._stopped(index, 0 if isinstance(obj, GoodResult) else 1, usage)
+        if worker.next():
+            self._started(worker.index)
+        else:
+            self._dispatch(worker)
+
+    def _exited(self, worker, code, rusage):
+        if worker.chunk:
+            index = worker.chunk.pop(0)
+            self._died(index, code)
+            self._stopped(index, code, None)
+            self.pending.extendleft(reversed(worker.chunk))
+            del worker.chunk[:]
+            worker.stop()
+            if self.pending:
+                self._start(worker)
+
+class _Output:
+    'Stand-in for a standard stream that passes complete lines written by a task to the sink of its thread, and anything else through.'
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    @contextmanager
+    def sink(self, callback):
+        self.local.callback = callback
+        self.local.buffer = ''
+        try:
+            yield
+        finally:
+            self.local.callback = None
+            if self.local.buffer:
+                callback(self.local.buffer)
+
+    def write(self, text):
+        callback = getattr(self.local, 'callback', None)
+        if callback is None:
+            return self.stream.write(text)
+        *lines, self.local.buffer = (self.local.buffer + text).split('\n')
+        self.local.callback = None # So that the callback itself can write.
+        try:
+            for line in lines:
+                callback(f"{line}\n")
+        finally:
+            self.local.callback = callback
+        return len(text)
+
+    def flush(self):
+        if getattr(self.local, 'callback', None) is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+@contextmanager
+def _captured():
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout, sys.stderr = outputs = _Output(stdout), _Output(stderr)
+    try:
+        yield outputs
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+
+def _threadrusage():
+    r = resource.getrusage(resource.RUSAGE_THREAD)
+    return Usage(None, r.ru_utime, r.ru_stime, r.ru_maxrss * 1024)
+
+class _LocalDrain(_Drain):
+    'Run tasks in this process, where output written via sys.stdout and sys.stderr is captured but output of subprocesses is not.'
+
+    def _run(self, index, outputs, rusage):
+        stdout, stderr = outputs
+        task = self.tasks[index]
+        start = time.perf_counter()
+        before = rusage()
+        with stdout.sink(partial(self._deliver, self.hooks.stdout, task)), stderr.sink(partial(self._deliver, self.hooks.stderr, task)):
+            with tracer.span('task', index = index):
+                code, obj = _run(task)
+        after = rusage()
+        if isinstance(obj, BadResult) and isinstance(obj.exception, KeyboardInterrupt):
+            raise obj.exception
+        self._deliver(self._done, index, code, obj, Usage(time.perf_counter() - start, after.utime - before.utime, after.stime - before.stime, after.maxrss))
+
+    def _done(self, index, code, obj, usage):
+        self.results[index] = obj.get
+        self.hooks.reported(self.tasks[index], obj)
+        self._stopped(index, code, usage)
+
+class _InlineDrain(_LocalDrain):
+
+    def __call__(self, limit, outputs):
+        while self.pending:
+            index = self.pending.popleft()
+            self._started(index)
+            self._run(index, outputs, _rusage)
+            self.hooks.tick()
+
+    def _deliver(self, f, *args):
+        f(*args)
+
+class _ThreadDrain(_LocalDrain):
+
+    def __call__(self, limit, outputs):
+        self.events = SimpleQueue()
+        while self.pending or self.running:
+            while self.pending and self.running < limit and self._admit(self.running):
+                index = self.pending.popleft()
+                self._started(index)
+                threading.Thread(target = self._run, args = [index, outputs, _threadrusage], daemon = True).start()
+                self.running += 1
+            timeout = self.hooks.tickinterval
+            if self.pending and self.running < limit:
+                timeout = self.loadinterval if timeout is None else min(timeout, self.loadinterval)
+            try:
+                event = self.events.get(timeout = timeout)
+                while True:
+                    event()
+                    event = self.events.get_nowait()
+            except Empty:
+                pass
+            self.hooks.tick()
+
+    def _deliver(self, f, *args):
+        self.events.put(partial(f, *args))
+
+    def _done(self, *args):
+        self.running -= 1
+        super()._done(*args)
 
 class Tasks(list):
 
-    def drain(self, limit):
-        def report(task, line):
-            index, obj = pickle.loads(b64decode(line))
-            results[index] = obj.get
-        streams = {}
-        running = 0
-        results = [None] * len(self)
-        while self or streams:
-            while self and running < limit:
-                job = Job(len(results) - len(self), self.pop(0))
-                r1, r2, rx = job.start()
-                streams[r1] = job, self.stdout
-                streams[r2] = job, self.stderr
-                streams[rx] = job, report
-                running += 1
-                self.started(job.task)
-            for r in select(streams, [], [])[0]:
-                line = r.readline()
-                if line:
-                    job, callback = streams[r]
-                    callback(job.task, line)
+    tickinterval = None
+
+    forkoverhead = .005
+    backends = 'fork', 'thread', 'inline', 'auto'
+
+    def drain(self, limit, pool = False, chunksize = None, maxload = None, membudget = None, backend = 'fork'):
+        'Run the tasks with at most limit at once and return their results in order, raising the first failure after all have finished.'
+        tasks = self[:]
+        del self[:]
+        if 'auto' == backend:
+            backend = self.choose(tasks, limit)
+        if 'fork' != backend:
+            drain = dict(thread = _ThreadDrain, inline = _InlineDrain)[backend](self, tasks, None, None, maxload, membudget)
+            with _captured() as outputs:
+                drain(limit, outputs)
+            return invokeall(drain.results)
+        gc.freeze() # Keep what we have so far out of collections in children, so its pages stay shared.
+        try:
+            with DefaultSelector() as selector, Reaper(selector) as reaper:
+                if pool:
+                    drain = _PoolDrain(self, tasks, selector, reaper, maxload, membudget)
+                    drain(limit, chunksize)
                 else:
-                    job = streams.pop(r)[0]
-                    r.close()
-                    code = job.decr()
-                    if code is not None:
-                        running -= 1
-                        self.stopped(job.task, code)
-        return invokeall(results)
+                    drain = _ForkDrain(self, tasks, selector, reaper, maxload, membudget)
+                    drain(limit)
+        finally:
+            gc.unfreeze() # Children have their own copy of the frozen state.
+        return invokeall(drain.results)
+
+    def choose(self, tasks, limit):
+        'Run in process when forking would cost more than the tasks are predicted to: inline if that is true of all of them together, otherwise on threads if true of each on average.'
+        total = sum(map(self.cost, tasks))
+        if total < self.forkoverhead:
+            return 'inline'
+        if total < self.forkoverhead * len(tasks):
+            return 'thread'
+        return 'fork'
+
+    def cost(self, task):
+        'Tasks with higher cost are started first.'
+        return 0
+
+    def memory(self, task):
+        'Predicted peak RSS in bytes, for the memory budget.'
+        return 0
+
+    def measured(self, task, usage):
+        pass
 
     def started(self, task):
         pass
@@ -137,5 +758,11 @@ class Tasks(list):
     def stderr(self, task, line):
         pass
 
+    def reported(self, task, result):
+        pass
+
     def stopped(self, task, code):
         pass
+
+    def tick(self):
+        pass
@@ -0,0 +1,115 @@
+# Copyright 2020 Andrzej Cichocki
+
+# This file is part of soak.
+#
+# soak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# soak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with soak.  If not, see <http://www.gnu.org/licenses/>.
+
+from .multifork import GoodResult, Tasks
+from .state import cachedirname
+from .trace import tracer
+from aridity.model import nullmonitor
+from aridity.repl import Repl
+from functools import partial
+from hashlib import sha256
+from importlib.metadata import version
+from lagoon.util import atomic
+import io, logging, pickle
+
+log = logging.getLogger(__name__)
+
+class _Recorder(Repl):
+    'Parse only, collecting the commands instead of executing them.'
+
+    def __init__(self):
+        super().__init__()
+        self.commands = []
+
+    def fire(self):
+        if self.commandsize:
+            self.commands.append(self.command.resolvables)
+
+class _Pickler(pickle.Pickler):
+
+    def persistent_id(self, obj):
+        if obj is nullmonitor:
+            return 'nullmonitor'
+
+class _Unpickler(pickle.Unpickler):
+
+    def persistent_load(self, pid):
+        if 'nullmonitor' == pid:
+            return nullmonitor
+        raise pickle.UnpicklingError(pid)
+
+def parse(text):
+    with tracer.span('parse'), _Recorder() as recorder:
+        for line in text.splitlines(True):
+            recorder(line)
+    f = io.BytesIO()
+    _Pickler(f, pickle.HIGHEST_PROTOCOL).dump(recorder.commands)
+    return f.getvalue()
+
+class ParseCache:
+    'Parsed config commands on disk, keyed by content hash.'
+
+    def __init__(self, soakroot):
+        self.dirpath = soakroot / cachedirname / 'parse'
+        self.salt = f"aridity {version('aridity')}\n".encode()
+
+    def _path(self, text):
+        return self.dirpath / sha256(self.salt + text.encode()).hexdigest()
+
+    def _get(self, path):
+        try:
+            with path.open('rb') as f:
+                return _Unpickler(f).load()
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log.warning("Ignoring unreadable parse cache entry %s: %s", path.name, e)
+
+    def _put(self, path, data):
+        with atomic(path) as partpath:
+            partpath.write_bytes(data)
+
+    def commands(self, text):
+        path = self._path(text)
+        commands = self._get(path)
+        if commands is None:
+            data = parse(text)
+            self._put(path, data)
+            commands = _Unpickler(io.BytesIO(data)).load()
+        return commands
+
+    def _reported(self, task, result):
+        if isinstance(result, GoodResult):
+            self._put(task.path, result.get())
+
+    def warm(self, configpaths, limit, pool):
+        'Parse the uncached configs in parallel, leaving any errors for the subsequent load to report.'
+        tasks = Tasks()
+        for configpath in configpaths:
+            text = configpath.read_text()
+            path = self._path(text)
+            if not path.exists():
+                task = partial(parse, text)
+                task.path = path
+                tasks.append(task)
+        if len(tasks) < 2:
+            return
+        tasks.reported = self._reported
+        try:
+            tasks.drain(limit, pool)
+        except Exception as e:
+            log.debug("Parse failed: %s", e)
@@ -0,0 +1,77 @@
+# Copyright 2020 Andrzej Cichocki
+
+# This file is part of soak.
+#
+# soak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# soak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with soak.  If not, see <http://www.gnu.org/licenses/>.
+
+'Split targets between independent runners and check that their manifests cover every target exactly once.'
+import heapq, json, logging
+
+log = logging.getLogger(__name__)
+
+def shardspec(text):
+    'Parse i/N into a pair where i counts from 1.'
+    i, n = map(int, text.split('/'))
+    if not 1 <= i <= n:
+        raise ValueError(text)
+    return i, n
+
+def partition(targets, count, cost):
+    'Deal the targets into count lists of similar total cost, most expensive first, the same way on every runner given the same costs.'
+    costs = {t: cost(t) for t in targets}
+    known = [c for c in costs.values() if c is not None]
+    default = sum(known) / len(known) if known else 1
+    costs = {t: default if c is None else c for t, c in costs.items()}
+    shards = [[] for _ in range(count)]
+    heap = [(0, i) for i in range(count)]
+    for target in sorted(costs, key = lambda t: (-costs[t], t)):
+        total, i = heapq.heappop(heap)
+        shards[i].append(target)
+        heapq.heappush(heap, (total + costs[target], i))
+    return [sorted(shard) for shard in shards]
+
+def writemanifest(path, shard, count, targets):
+    with open(path, 'w') as f:
+        json.dump(dict(shard = shard, count = count, targets = sorted(targets)), f, indent = 1)
+
+def verify(manifestpaths, targets):
+    'Log every problem with the given manifests against the expected targets, and return whether there were none.'
+    ok = True
+    def error(*args):
+        nonlocal ok
+        log.error(*args)
+        ok = False
+    manifests = []
+    for path in manifestpaths:
+        with open(path) as f:
+            manifests.append(json.load(f))
+    counts = {m['count'] for m in manifests}
+    if 1 != len(counts):
+        error("Inconsistent shard counts: %s", sorted(counts))
+    shards = sorted(m['shard'] for m in manifests)
+    if shards != list(range(1, max(counts, default = 0) + 1)):
+        error("Expected each shard exactly once, got: %s", shards)
+    owners = {}
+    for path, m in zip(manifestpaths, manifests):
+        for target in m['targets']:
+            owners.setdefault(target, []).append(path)
+    expected = set(map(str, targets))
+    for target in sorted(expected - owners.keys()):
+        error("Not covered: %s", target)
+    for target, paths in sorted(owners.items()):
+        if target not in expected:
+            error("Unexpected: %s", target)
+        elif len(paths) > 1:
+            error("Covered %s times: %s", len(paths), target)
+    return ok
@@ -16,40 +16,327 @@
 # along with soak.  If not, see <http://www.gnu.org/licenses/>.
 
 'Process aridity templates as per all soak.arid configs in directory tree.'
-from . import cpuexecutor
+from .archive import openbundle
 from .context import createparent
-from .multifork import Tasks
+from .diff import textdiff
+from .discovery import defaultprune, Discovery, gitchanges, Selection
+from .multifork import GoodResult, Tasks
+from .parsecache import ParseCache
+from .shard import partition, shardspec, verify, writemanifest
+from .state import BuildState, loadrecords, newrecord, openrecorder, samecontent, writeifchanged
 from .terminal import getterminal, Style
+from .trace import profiled, tracer
+from .util import sharedmemo
+from .watch import Inotify, Overflow
 from argparse import ArgumentParser
-from diapyr.util import invokeall
+from aridity.model import Entry, Text
 from functools import partial
-from lagoon import diff
 from lagoon.util import atomic
 from pathlib import Path
-import logging, os, sys
+import json, locale, logging, os, sys, time
 
 log = logging.getLogger(__name__)
 
 class SoakConfig:
 
+    filename = 'soak.arid'
     soakkey = 'soak'
+    chunksize = 0x100000
 
-    def __init__(self, parent, configpath):
-        self.node = (-parent).childctrl().node
-        self.node.cwd = str(configpath.parent.resolve())
-        (-self.node).printf(". %s", configpath.name)
+    def __init__(self, parent, configpath, parsecache):
+        with tracer.span('load', config = str(configpath)), openrecorder() as self.inputs:
+            ctrl = (-parent).childctrl()
+            self.node = ctrl.node
+            self.node.cwd = str(configpath.parent.resolve())
+            scope = ctrl.basescope
+            with Text(configpath.name).openable(scope).pushopen(scope) as f:
+                for resolvables in parsecache.commands(f.read()):
+                    scope.execute(Entry(resolvables))
         self.reltargets = [Path(rt) for rt, _ in (-getattr(self.node, self.soakkey)).scope().resolvables.items()]
         self.dirpath = configpath.parent
 
-    def process(self, reltarget):
-        with atomic(self.dirpath / reltarget) as partpath:
-            (-self.node).scope().resolved(self.soakkey, str(reltarget), 'data').writeout(partpath)
+    def _data(self, reltarget):
+        with tracer.span('resolve', target = str(self.dirpath / reltarget)):
+            return (-self.node).scope().resolved(self.soakkey, str(reltarget), 'data')
+
+    @staticmethod
+    def _bytes(data):
+        try:
+            return data.binaryvalue
+        except AttributeError:
+            return data.textvalue.encode(locale.getpreferredencoding(False)) # Same as writeout.
+
+    def process(self, reltarget, profilepath = None):
+        target = self.dirpath / reltarget
+        with profiled(profilepath):
+            with openrecorder() as inputs:
+                data = self._data(reltarget)
+            with tracer.span('writeout', target = str(target)):
+                b = self._bytes(data)
+                digest = writeifchanged(target, (b[i:i + self.chunksize] for i in range(0, len(b), self.chunksize)))
+            return newrecord(self.inputs | inputs, digest)
+
+    def template(self, reltarget):
+        'Absolute path of the template the target is rendered from, or None if it has none.'
+        try:
+            path = (-self.node).scope().resolved(self.soakkey, str(reltarget), 'from').cat()
+        except Exception:
+            return
+        return os.path.normpath(os.path.join(self.node.cwd, path))
+
+    def render(self, reltarget):
+        return self._bytes(self._data(reltarget))
+
+    def check(self, reltarget):
+        data = self._data(reltarget)
+        with tracer.span('check', target = str(self.dirpath / reltarget)):
+            return samecontent(self._bytes(data), self.dirpath / reltarget)
 
     def origtext(self, reltarget):
-        return getattr(getattr(self.node, self.soakkey), str(reltarget)).diff
+        with tracer.span('resolve', target = str(self.dirpath / reltarget)):
+            return getattr(getattr(self.node, self.soakkey), str(reltarget)).diff
+
+    def diff(self, reltarget):
+        origtext = self.origtext(reltarget)
+        with tracer.span('diff', target = str(self.dirpath / reltarget)):
+            return textdiff(origtext, self.dirpath / reltarget)
+
+class Session:
+    'Keep the configs under soakroot loaded so that targets can be rendered repeatedly in process, paying for parsing once.'
+
+    def __init__(self, soakroot = '.', prune = (), walk = False, limit = None, pool = False, select = None):
+        self.soakroot = Path(soakroot)
+        self.prune = defaultprune.union(prune)
+        self.walk = walk
+        self.select = select
+        self.parent = createparent(self.soakroot)
+        self.parsecache = ParseCache(self.soakroot)
+        with tracer.span('discovery'):
+            configpaths = [p for p in Discovery(self.soakroot, SoakConfig.filename, self.prune)(not walk) if self._wanted(p)]
+        self.parsecache.warm(configpaths, os.cpu_count() if limit is None else limit, pool)
+        self.soakconfigs = {p: self._load(p) for p in configpaths}
+        self._index()
+
+    def _wanted(self, configpath):
+        return self.select is None or self.select.under(self._relpath(configpath.parent))
+
+    def _load(self, configpath):
+        soakconfig = SoakConfig(self.parent, configpath, self.parsecache)
+        if self.select is not None:
+            soakconfig.reltargets = [rt for rt in soakconfig.reltargets if self.select(self._relpath(soakconfig.dirpath / rt))]
+        return soakconfig
+
+    def _relpath(self, path):
+        return Path(os.path.relpath(self.soakroot / path, self.soakroot))
+
+    def _index(self):
+        self.lookup = {}
+        for soakconfig in self.soakconfigs.values():
+            for reltarget in soakconfig.reltargets:
+                self.lookup[self._relpath(soakconfig.dirpath / reltarget)] = soakconfig, reltarget
+
+    def targets(self):
+        'All target paths relative to soakroot, in config order.'
+        return list(self.lookup)
+
+    def touched(self, changed):
+        'Targets that the given changed paths may affect: all of a config when one is under its directory or among its inputs, otherwise those with a changed template. Any changed Python module affects everything, as which plugins a target imports is only known once rendered. Other files read only while rendering, outside the config directory, are not detected.'
+        changed = {os.path.abspath(self.soakroot / p) for p in changed}
+        changed = {p for p in changed if self.prune.isdisjoint(Path(p).parts)} # Such as our own cache.
+        anymodule = any(p.endswith('.py') for p in changed)
+        for soakconfig in self.soakconfigs.values():
+            prefix = os.path.join(os.path.abspath(soakconfig.dirpath), '')
+            whole = anymodule or not changed.isdisjoint(soakconfig.inputs) or any(p.startswith(prefix) for p in changed)
+            for reltarget in soakconfig.reltargets:
+                if whole or soakconfig.template(reltarget) in changed:
+                    yield self._relpath(soakconfig.dirpath / reltarget)
+
+    def narrow(self, targets):
+        'Forget all but the given targets.'
+        targets = set(map(self._relpath, targets))
+        for soakconfig in self.soakconfigs.values():
+            soakconfig.reltargets = [rt for rt in soakconfig.reltargets if self._relpath(soakconfig.dirpath / rt) in targets]
+        self._index()
+
+    def render(self, target):
+        'Bytes of the given target, a path relative to soakroot or absolute.'
+        try:
+            soakconfig, reltarget = self.lookup[self._relpath(target)]
+        except KeyError:
+            raise KeyError(f"No such target: {target}")
+        return soakconfig.render(reltarget)
+
+    def render_many(self, targets, executor = None, limit = None, pool = False):
+        'List of the bytes, or for large ones memoryviews, of the given targets, rendered via the given concurrent.futures executor, or else the named Tasks backend which by default is fork.'
+        if not isinstance(executor, (str, type(None))):
+            return list(executor.map(self.render, targets))
+        tasks = Tasks()
+        for target in targets:
+            tasks.append(partial(self.render, target))
+        with sharedmemo():
+            return list(tasks.drain(os.cpu_count() if limit is None else limit, pool, backend = executor or 'fork'))
+
+    def invalidate(self, paths):
+        'Reload the configs affected by the given changed paths, or all of them if None, and return their paths.'
+        if paths is not None:
+            paths = {os.path.abspath(self.soakroot / p) for p in paths}
+        configpaths = {p for p, c in self.soakconfigs.items() if paths is None or not paths.isdisjoint(c.inputs)}
+        for path in paths or ():
+            relpath = self.soakroot / self._relpath(path)
+            if SoakConfig.filename == relpath.name:
+                configpaths.add(relpath)
+            elif relpath.is_dir() and not relpath.is_symlink():
+                configpaths.update(p for p in relpath.rglob(SoakConfig.filename) if self.prune.isdisjoint(p.parts[:-1]))
+        configpaths = {p for p in configpaths if self._wanted(p)}
+        for configpath in configpaths:
+            if not configpath.exists():
+                log.info("Removed: %s", configpath)
+                self.soakconfigs.pop(configpath, None)
+                continue
+            try:
+                self.soakconfigs[configpath] = self._load(configpath)
+            except Exception:
+                log.exception("Failed to load: %s", configpath)
+        self._index()
+        return configpaths
+
+class Ordered:
+    'Pass the values of reported results to consume in task order, as soon as all earlier ones have arrived.'
+
+    def __init__(self, consume):
+        self.consume = consume
+        self.results = {}
+        self.cursor = 0
 
-    def diff(self, origtext, reltarget):
-        diff._us[print]('--color=always', '-', self.dirpath / reltarget, input = origtext, check = False)
+    def __call__(self, task, result):
+        self.results[task.index] = task, result
+        while self.cursor in self.results:
+            task, result = self.results.pop(self.cursor)
+            self.cursor += 1
+            if isinstance(result, GoodResult):
+                self.consume(task, result.get())
+
+def _render(soakconfigs, state, config, affected = None):
+    terminal = getterminal(config.viewport)
+    tasks = Tasks()
+    fresh = 0
+    for soakconfig in soakconfigs:
+        for reltarget in soakconfig.reltargets:
+            target = soakconfig.dirpath / reltarget
+            if affected is not None and target not in affected:
+                continue
+            if state.isfresh(target):
+                fresh += 1
+                continue
+            task = partial(soakconfig.process, reltarget, None if config.profile is None else Path(config.profile, f"{target}.prof"))
+            task.index = len(tasks)
+            task.target = target
+            terminal.head(task.index, task.target, Style.pending)
+            tasks.append(task)
+    if fresh:
+        log.info("Fresh targets: %s", fresh)
+    def measured(task, usage):
+        task.usage = usage
+        state.measured(task.target, usage)
+    def stopped(task, code):
+        task.code = code
+        terminal.head(task.index, f"{task.target} ({task.usage})" if hasattr(task, 'usage') else task.target, Style.abrupt if code else Style.normal)
+    tasks.cost = lambda task: state.duration(task.target)
+    tasks.memory = lambda task: state.memory(task.target)
+    tasks.started = lambda task: terminal.head(task.index, task.target, Style.running)
+    tasks.stdout = lambda task, line: terminal.log(task.index, sys.stdout, line)
+    tasks.stderr = lambda task, line: terminal.log(task.index, sys.stderr, line)
+    tasks.reported = lambda task, result: state.put(task.target, result)
+    tasks.measured = measured
+    tasks.stopped = stopped
+    tasks.tick = terminal.tick
+    tasks.tickinterval = terminal.tickinterval
+    dispatched = tasks[:]
+    start = time.perf_counter()
+    try:
+        tasks.drain(config.j, maxload = config.l, membudget = config.mem_budget) # A fresh fork per target, as in process or in a pool worker modules imported by earlier targets would not be recorded as inputs.
+    finally:
+        terminal.flush()
+        state.save()
+        _summary(dispatched, time.perf_counter() - start, config)
+
+def _summary(tasks, wall, config):
+    measured = [task for task in tasks if hasattr(task, 'usage')]
+    if measured:
+        longest = max(measured, key = lambda task: task.usage.wall)
+        total = sum(task.usage.wall for task in measured)
+        log.info("Wall %.2fs against lower bound %.2fs: longest target %s took %.2fs, all targets %.2fs wall %.2fs cpu, jobs %s.",
+                wall, max(longest.usage.wall, total / config.j), longest.target, longest.usage.wall, total, sum(task.usage.cpu for task in measured), config.j)
+    if config.stats is not None:
+        with atomic(Path(config.stats)) as partpath, partpath.open('w') as f:
+            json.dump(dict(wall = wall, jobs = config.j, targets = {str(task.target): dict(task.usage._asdict(), code = task.code) for task in measured}), f, indent = 1, sort_keys = True)
+
+def _jobs(text):
+    'Parse a job count, which must be at least 1.'
+    n = int(text)
+    if n < 1:
+        raise ValueError(text)
+    return n
+
+def _bytesize(text):
+    'Parse a byte count with optional K, M, G or T binary suffix.'
+    units = 'KMGT'
+    i = units.find(text[-1:].upper())
+    return round(float(text if i < 0 else text[:-1]) * (1 << 10 * (i + 1)))
+
+class Watch:
+    'Keep the parsed configs resident and rerender only the targets affected by each batch of changes.'
+
+    debounce = .2
+
+    def __init__(self, session, state, config):
+        self.session = session
+        self.state = state
+        self.config = config
+
+    def _dirs(self, changed):
+        for soakconfig in self.session.soakconfigs.values(): # First in case we run out of watches.
+            for path in soakconfig.inputs:
+                yield os.path.dirname(path)
+            for reltarget in soakconfig.reltargets:
+                for path in self.state.inputs(soakconfig.dirpath / reltarget):
+                    yield os.path.dirname(path)
+        if changed is None or any(os.path.isdir(p) for p in changed): # Watches of removed dirs go by themselves.
+            self.tree = Discovery(self.session.soakroot, SoakConfig.filename, self.session.prune).dirs(not self.session.walk) # So that new configs anywhere are seen.
+        yield from self.tree
+
+    def _relevant(self, changed):
+        'Exclude paths in pruned dirs, such as our own cache.'
+        return {p for p in changed if self.session.prune.isdisjoint(Path(os.path.relpath(p, self.session.soakroot)).parts)}
+
+    def _affected(self, changed, configpaths):
+        for configpath, soakconfig in self.session.soakconfigs.items():
+            for reltarget in soakconfig.reltargets:
+                target = soakconfig.dirpath / reltarget
+                if changed is None or configpath in configpaths or not changed.isdisjoint(self.state.inputs(target)):
+                    yield target
+
+    def __call__(self):
+        with Inotify() as inotify:
+            changed = None
+            while True:
+                for dirpath in self._dirs(changed):
+                    inotify.watch(dirpath)
+                try:
+                    changed = self._relevant(inotify.changes(self.debounce))
+                    if not changed:
+                        continue
+                except Overflow:
+                    log.warning('Too many changes, reloading everything.')
+                    changed = None
+                affected = set(self._affected(changed, self.session.invalidate(changed)))
+                if affected:
+                    self.state.nextround()
+                    try:
+                        with sharedmemo():
+                            _render(self.session.soakconfigs.values(), self.state, self.config, affected)
+                    except Exception as e:
+                        log.error("Failed: %s", e)
 
 def main():
     logging.basicConfig(format = "[%(levelname)s] %(message)s", level = logging.DEBUG)
@@ -57,35 +344,124 @@ def main():
     parser.add_argument('-n', action = 'store_true')
     parser.add_argument('-d', action = 'store_true')
     parser.add_argument('-v', action = 'store_true')
+    parser.add_argument('-j', type = _jobs, default = os.cpu_count())
+    parser.add_argument('-l', type = float)
+    parser.add_argument('--mem-budget', type = _bytesize)
+    parser.add_argument('--stats')
+    parser.add_argument('--force', action = 'store_true')
+    parser.add_argument('--check', action = 'store_true')
+    parser.add_argument('--pool', action = 'store_true')
+    parser.add_argument('--executor', choices = Tasks.backends, default = 'auto')
+    parser.add_argument('--viewport', type = int)
+    parser.add_argument('--watch', action = 'store_true')
+    parser.add_argument('--prune', action = 'append', default = [])
+    parser.add_argument('--walk', action = 'store_true')
+    parser.add_argument('--trace')
+    parser.add_argument('--profile')
+    parser.add_argument('--output-archive')
+    parser.add_argument('--list', action = 'store_true')
+    parser.add_argument('--since')
+    parser.add_argument('--shard', type = shardspec)
+    parser.add_argument('--shard-costs')
+    parser.add_argument('--shard-manifest')
+    parser.add_argument('--verify-shards', nargs = '+')
+    parser.add_argument('targets', nargs = '*')
     config = parser.parse_args()
+    if config.watch and config.n:
+        parser.error('--watch renders so cannot be combined with -n')
+    if config.watch and config.output_archive is not None:
+        parser.error('--watch cannot be combined with --output-archive')
+    if config.watch and config.shard is not None:
+        parser.error('--watch cannot be combined with --shard')
     if not config.v:
         logging.getLogger().setLevel(logging.INFO)
-    soakroot = Path('.')
-    parent = createparent(soakroot)
-    soakconfigs = [SoakConfig(parent, p) for p in soakroot.rglob('soak.arid')]
+    tracer.enabled = config.trace is not None
+    try:
+        with sharedmemo():
+            _soak(config)
+    finally:
+        if tracer.enabled:
+            tracer.save(Path(config.trace))
+
+def _historical(tasks, soakroot):
+    'Use the render durations and peak memory of the last run to order and admit the tasks and choose the backend.'
+    state = BuildState(soakroot, False)
+    tasks.cost = lambda task: state.duration(task.target)
+    tasks.memory = lambda task: state.memory(task.target)
+
+def _bundle(soakroot, soakconfigs, config):
+    tasks = Tasks()
+    _historical(tasks, soakroot)
+    for soakconfig in soakconfigs:
+        for reltarget in soakconfig.reltargets:
+            task = partial(soakconfig.render, reltarget)
+            task.index = len(tasks)
+            task.target = soakconfig.dirpath / reltarget
+            tasks.append(task)
+    tasks.stdout = tasks.stderr = lambda task, line: sys.stderr.write(line) # Stdout may be the bundle.
+    with openbundle(config.output_archive) as bundle:
+        tasks.reported = Ordered(lambda task, data: bundle.add(str(task.target), data))
+        tasks.drain(config.j, config.pool, maxload = config.l, membudget = config.mem_budget, backend = config.executor)
+
+def _soak(config):
+    select = Selection(config.targets) if config.targets else None
+    session = Session(prune = config.prune, walk = config.walk, limit = config.j, pool = config.pool, select = select)
+    if config.since is not None:
+        session.narrow(list(session.touched(gitchanges(session.soakroot, config.since))))
+    if config.shard is not None:
+        shard, count = config.shard
+        records = {} if config.shard_costs is None else loadrecords(Path(config.shard_costs)) # Not our own state, which may differ between runners.
+        session.narrow(partition(list(map(str, session.targets())), count, lambda t: records.get(t, {}).get('duration'))[shard - 1])
+        if config.shard_manifest is not None:
+            writemanifest(config.shard_manifest, shard, count, map(str, session.targets()))
+    if config.verify_shards:
+        sys.exit(0 if verify(config.verify_shards, session.targets()) else 1)
+    if config.list:
+        for target in session.targets():
+            print(target)
+        return
+    soakconfigs = list(session.soakconfigs.values())
+    if config.check:
+        tasks = Tasks()
+        _historical(tasks, session.soakroot)
+        for soakconfig in soakconfigs:
+            for reltarget in soakconfig.reltargets:
+                task = partial(soakconfig.check, reltarget)
+                task.target = soakconfig.dirpath / reltarget
+                tasks.append(task)
+        targets = [task.target for task in tasks]
+        stale = [target for target, same in zip(targets, tasks.drain(config.j, config.pool, maxload = config.l, membudget = config.mem_budget, backend = config.executor)) if not same]
+        for target in stale:
+            log.error("Stale: %s", target)
+        sys.exit(1 if stale else 0)
+    if config.output_archive is not None:
+        _bundle(session.soakroot, soakconfigs, config)
+        return
     if not config.n:
-        terminal = getterminal()
+        state = BuildState(session.soakroot, config.force)
+        if select is not None or config.since is not None or config.shard is not None:
+            targets = set(map(str, session.targets()))
+            state.retain(lambda key: key not in targets)
+        try:
+            _render(soakconfigs, state, config)
+        except Exception as e:
+            if not config.watch:
+                raise
+            log.error("Failed: %s", e)
+    if config.d:
         tasks = Tasks()
+        _historical(tasks, session.soakroot)
         for soakconfig in soakconfigs:
             for reltarget in soakconfig.reltargets:
-                task = partial(soakconfig.process, reltarget)
+                task = partial(soakconfig.diff, reltarget)
                 task.index = len(tasks)
                 task.target = soakconfig.dirpath / reltarget
-                terminal.head(task.index, task.target, Style.pending)
                 tasks.append(task)
-        tasks.started = lambda task: terminal.head(task.index, task.target, Style.running)
-        tasks.stdout = lambda task, line: terminal.log(task.index, sys.stdout, line)
-        tasks.stderr = lambda task, line: terminal.log(task.index, sys.stderr, line)
-        tasks.stopped = lambda task, code: terminal.head(task.index, task.target, Style.abrupt if code else Style.normal)
-        tasks.drain(os.cpu_count())
-    if config.d:
-        with cpuexecutor() as executor:
-            diffs = []
-            for soakconfig in soakconfigs:
-                for reltarget in soakconfig.reltargets:
-                    diffs.append(partial(lambda soakconfig, origtextfuture, reltarget: soakconfig.diff(origtextfuture.result(), reltarget),
-                            soakconfig, executor.submit(soakconfig.origtext, reltarget), reltarget))
-            invokeall(diffs)
+        tasks.stdout = tasks.stderr = lambda task, line: sys.stderr.write(line)
+        tasks.reported = Ordered(lambda task, text: sys.stdout.write(text))
+        tasks.drain(config.j, config.pool, maxload = config.l, membudget = config.mem_budget, backend = config.executor)
+    if config.watch:
+        Watch(session, state, config)()
 
 if '__main__' == __name__:
     main()
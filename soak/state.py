@@ -0,0 +1,254 @@
+# Copyright 2020 Andrzej Cichocki
+
+# This file is part of soak.
+#
+# soak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# soak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with soak.  If not, see <http://www.gnu.org/licenses/>.
+
+from contextlib import contextmanager
+from diapyr.util import singleton
+from functools import partial
+from hashlib import sha256
+from importlib.util import source_from_cache
+from lagoon.util import atomic
+import json, logging, math, mmap, os, sys, threading
+
+log = logging.getLogger(__name__)
+cachedirname = '.soak-cache'
+bufsize = 0x10000
+comparesize = 0x100000
+writemodechars = frozenset('wax+')
+cachedirpart = f"{os.sep}{cachedirname}{os.sep}"
+systemprefixes = tuple({os.path.join(p, '') for p in [sys.prefix, sys.base_prefix, sys.exec_prefix, sys.base_exec_prefix]})
+
+def filedigest(path):
+    h = sha256()
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return
+    with f:
+        for block in iter(partial(f.read, bufsize), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def samecontent(data, path):
+    'Whether the file at path holds exactly the given bytes, without reading it into memory.'
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return False
+    with f:
+        size = os.fstat(f.fileno()).st_size
+        if size != len(data):
+            return False
+        if not size:
+            return True
+        with mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ) as m:
+            return all(m[i:i + comparesize] == data[i:i + comparesize] for i in range(0, size, comparesize))
+
+class _Writer:
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            self.old = path.open('rb')
+        except FileNotFoundError:
+            self.old = None
+        self.same = 0
+        self.part = None
+        self.h = sha256()
+
+    def write(self, data):
+        self.h.update(data)
+        if self.part is None:
+            if self.old is not None and self.old.read(len(data)) == data:
+                self.same += len(data)
+                return
+            self._diverge()
+        self.part.write(data)
+
+    def _diverge(self):
+        'Start the partial file with the prefix we know is unchanged.'
+        self.path.parent.mkdir(parents = True, exist_ok = True)
+        self.partpath = self.path.with_name(f".{self.path.name}.{os.getpid()}.part")
+        self.part = open(os.open(self.partpath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666), 'wb') # Subject to umask like any new file.
+        if self.same:
+            self.old.seek(0)
+            n = self.same
+            while n:
+                block = self.old.read(min(n, bufsize))
+                self.part.write(block)
+                n -= len(block)
+
+    def commit(self):
+        if self.part is None and (self.old is None or self.old.read(1)):
+            self._diverge() # New or truncated.
+        if self.old is not None:
+            self.old.close()
+        if self.part is not None:
+            self.part.close()
+            os.replace(self.partpath, self.path)
+            return True
+
+    def abort(self):
+        if self.old is not None:
+            self.old.close()
+        if self.part is not None:
+            self.part.close()
+            os.remove(self.partpath)
+
+def writeifchanged(path, chunks):
+    'Stream the chunks into path via a partial file that is only created once they differ from the existing content, so an unchanged file is not touched. Return the sha256 hex digest.'
+    w = _Writer(path)
+    try:
+        for chunk in chunks:
+            w.write(chunk)
+    except BaseException:
+        w.abort()
+        raise
+    if w.commit():
+        log.debug("Changed: %s", path)
+    return w.h.hexdigest()
+
+def _isinput(path):
+    return not path.startswith(systemprefixes) and cachedirpart not in path and '__pycache__' != os.path.basename(os.path.dirname(path)) and (os.path.isfile(path) or not os.path.lexists(path))
+
+@singleton
+class openrecorder:
+    'Collect the paths of files opened for reading, via the open audit event.'
+
+    installed = False
+
+    def __init__(self):
+        self.local = threading.local() # Targets rendered on other threads have their own inputs.
+
+    @property
+    def pathsets(self):
+        try:
+            return self.local.pathsets
+        except AttributeError:
+            self.local.pathsets = pathsets = []
+            return pathsets
+
+    def _hook(self, event, args):
+        if 'open' == event and self.pathsets:
+            path, mode, flags = args
+            if isinstance(path, (str, bytes)) and (os.O_RDONLY == flags & os.O_ACCMODE if mode is None else writemodechars.isdisjoint(mode)):
+                path = os.path.abspath(os.fsdecode(path))
+                if path.endswith('.pyc'):
+                    try:
+                        path = source_from_cache(path) # Once cached the source itself is not opened.
+                    except ValueError:
+                        pass
+                for paths in self.pathsets:
+                    paths.add(path)
+
+    @contextmanager
+    def __call__(self):
+        if not self.installed:
+            sys.addaudithook(self._hook)
+            self.installed = True
+        paths = set()
+        self.pathsets.append(paths)
+        try:
+            yield paths
+        finally:
+            self.pathsets.remove(paths)
+
+def newrecord(inputpaths, outputdigest):
+    return dict(
+        inputs = {p: filedigest(p) for p in sorted(inputpaths) if _isinput(p)},
+        output = outputdigest,
+    )
+
+def loadrecords(path):
+    'Target records saved at path, or none if there are none readable.'
+    try:
+        with path.open() as f:
+            return json.load(f)['targets']
+    except FileNotFoundError:
+        return {}
+    except (KeyError, ValueError) as e:
+        log.warning("Ignoring unreadable build state: %s", e)
+        return {}
+
+class BuildState:
+
+    def __init__(self, soakroot, force):
+        self.path = soakroot / cachedirname / 'build.json'
+        self.records = {} if force else self._load()
+        self.newrecords = {}
+        self.digests = {}
+        self.usages = {}
+
+    def _load(self):
+        return loadrecords(self.path)
+
+    def _digest(self, path):
+        try:
+            return self.digests[path]
+        except KeyError:
+            self.digests[path] = d = filedigest(path)
+            return d
+
+    def isfresh(self, target):
+        key = str(target)
+        try:
+            record = self.records[key]
+        except KeyError:
+            return False
+        if self._digest(key) != record['output'] or not all(self._digest(p) == d for p, d in record['inputs'].items()):
+            return False
+        self.newrecords[key] = record
+        return True
+
+    def retain(self, keep):
+        'Carry over the saved records of targets that keep accepts, such as those not selected for this run.'
+        self.newrecords.update((key, record) for key, record in self._load().items() if keep(key))
+
+    def put(self, target, result):
+        try:
+            self.newrecords[str(target)] = result.get()
+        except Exception:
+            pass # Drain will raise it.
+
+    def duration(self, target):
+        'Seconds the target took last time, or infinity if unknown so that it is started early.'
+        return self.records.get(str(target), {}).get('duration', math.inf)
+
+    def memory(self, target):
+        'Peak RSS in bytes last time, or 0 if unknown.'
+        return self.records.get(str(target), {}).get('maxrss', 0)
+
+    def measured(self, target, usage):
+        self.usages[str(target)] = usage
+
+    def nextround(self):
+        'Start again from the records so far, keeping the ones that are not revisited.'
+        self.records = self.newrecords
+        self.newrecords = dict(self.records)
+        self.digests.clear()
+
+    def inputs(self, target):
+        try:
+            return self.newrecords[str(target)]['inputs']
+        except KeyError:
+            return {}
+
+    def save(self):
+        for key, usage in self.usages.items():
+            if key in self.newrecords:
+                self.newrecords[key].update(duration = round(usage.wall, 3), cpu = round(usage.cpu, 3), maxrss = usage.maxrss)
+        with atomic(self.path) as partpath, partpath.open('w') as f:
+            json.dump(dict(targets = self.newrecords), f, indent = 1, sort_keys = True)
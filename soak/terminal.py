@@ -15,11 +15,13 @@
 # You should have received a copy of the GNU General Public License
 # along with soak.  If not, see <http://www.gnu.org/licenses/>.
 
+from .trace import tracer
+from collections import deque
 from diapyr.util import singleton
+from functools import lru_cache
+from io import UnsupportedOperation
 from itertools import islice
-from lagoon import tput
-from subprocess import CalledProcessError
-import sys
+import curses, os, shutil, sys, time
 
 class Style:
 
@@ -28,60 +30,155 @@ class Style:
     normal = object()
     abrupt = object()
 
-class Terminal:
+@lru_cache(maxsize = None)
+def _tput(name, *params):
+    s = curses.tigetstr(name)
+    return '' if s is None else curses.tparm(s, *params).decode('latin-1')
 
-    class Section:
+class Fenwick:
+    'List of numbers with O(log n) update and prefix sum.'
 
-        height = 0
+    def __init__(self):
+        self.values = []
+        self.tree = [0]
 
-    def __init__(self, width):
-        self.sections = []
-        self.width = width
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, i):
+        return self.values[i]
+
+    def __setitem__(self, i, value):
+        delta = value - self.values[i]
+        self.values[i] = value
+        i += 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def append(self, value):
+        self.values.append(0)
+        n = len(self.values)
+        self.tree.append(self.prefix(n - 1) - self.prefix(n - (n & -n)))
+        self[n - 1] = value
+
+    def prefix(self, n):
+        total = 0
+        while n:
+            total += self.tree[n]
+            n -= n & -n
+        return total
 
-    def _common(self, index, tonewh):
-        dy = sum(s.height for s in islice(self.sections, index + 1, None))
-        section = self.sections[index]
-        oldh = section.height
-        section.height = newh = tonewh(oldh)
+    def suffix(self, i):
+        return self.prefix(len(self.values)) - self.prefix(i)
+
+class Terminal:
+
+    tickinterval = 1 / 30
+    summarypos = 0
+
+    def __init__(self, width, viewport = None):
+        self.heights = Fenwick()
+        self.heights.append(0)
+        self.width = width
+        self.viewport = viewport
+        self.recent = deque()
+        self.pending = 0
+        self.collapsed = 0
+        self.frame = []
+        self.flushtime = time.monotonic()
+
+    def _write(self, stream, text):
+        if self.frame and self.frame[-1][0] is stream:
+            self.frame[-1][1].append(text)
+        else:
+            self.frame.append((stream, [text]))
+
+    def tick(self):
+        if self.frame and time.monotonic() - self.flushtime >= self.tickinterval:
+            self.flush()
+
+    def flush(self):
+        if self.frame:
+            with tracer.span('terminal'):
+                for stream, texts in self.frame:
+                    stream.write(''.join(texts))
+                    stream.flush()
+            self.frame.clear()
+        self.flushtime = time.monotonic()
+
+    def _common(self, pos, tonewh):
+        dy = self.heights.suffix(pos + 1)
+        oldh = self.heights[pos]
+        self.heights[pos] = newh = tonewh(oldh)
         if dy:
-            tput.cuu(dy, stdout = sys.stderr)
+            self._write(sys.stderr, _tput('cuu', dy))
         if newh > oldh:
-            tput.il(newh - oldh, stdout = sys.stderr)
+            self._write(sys.stderr, _tput('il', newh - oldh))
         return dy, oldh, newh
 
-    def head(self, index, obj, style):
-        for _ in range(len(self.sections), index + 1):
-            self.sections.append(self.Section())
-        dy, oldh, newh = self._common(index, lambda h: max(1, h))
+    def _head(self, pos, text):
+        dy, oldh, newh = self._common(pos, lambda h: max(1, h))
         if oldh:
-            tput.cuu(oldh, stdout = sys.stderr)
+            self._write(sys.stderr, _tput('cuu', oldh))
+        self._write(sys.stderr, f"{text}{_tput('sgr0')}{_tput('el')}\n")
+        self._write(sys.stderr, '\n' * (newh - 1 + dy))
+
+    def _summary(self):
+        self._head(self.summarypos, f"[Soaked: {self.collapsed}, pending: {self.pending}]")
+
+    def _collapse(self, pos):
+        h = self.heights[pos]
+        dy = self.heights.suffix(pos + 1)
+        self.heights[pos] = 0
+        self._write(sys.stderr, _tput('cuu', dy + h))
+        self._write(sys.stderr, _tput('dl', h))
+        self._write(sys.stderr, '\n' * dy)
+        self.collapsed += 1
+
+    def head(self, index, obj, style):
+        pos = index + 1
+        for _ in range(len(self.heights), pos + 1):
+            self.heights.append(0)
+        if self.viewport is not None:
+            if Style.pending == style:
+                self.pending += 1
+                self._summary()
+                self.tick()
+                return
+            if Style.running == style:
+                self.pending -= 1
         if Style.pending == style:
-            tput.setaf(0, stdout = sys.stderr)
+            prefix = _tput('setaf', 0)
         elif Style.running == style:
-            tput.rev(stdout = sys.stderr)
+            prefix = _tput('rev')
         elif Style.abrupt == style:
-            tput.setab(1, stdout = sys.stderr)
-            tput.setaf(7, stdout = sys.stderr)
-        sys.stderr.write(f"[{obj}]{tput.sgr0()}\n")
-        sys.stderr.write('\n' * (newh - 1 + dy))
+            prefix = _tput('setab', 1) + _tput('setaf', 7)
+        else:
+            prefix = ''
+        self._head(pos, f"{prefix}[{obj}]")
+        if self.viewport is not None:
+            if Style.normal == style:
+                self.recent.append(pos)
+                while len(self.recent) > self.viewport:
+                    self._collapse(self.recent.popleft())
+            self._summary()
+        self.tick()
 
     def log(self, index, stream, line):
-        dy, oldh, newh = self._common(index, lambda h: h + 1)
-        noeol, = line.splitlines()
+        dy, oldh, newh = self._common(index + 1, lambda h: h + 1)
+        noeol = line[:-1] if line.endswith('\n') else line # Not splitlines, which also breaks at the likes of form feed.
         eol = line[len(noeol):]
         if noeol:
             chunks = [noeol[i:i + self.width] for i in range(0, len(noeol), self.width)]
-            stream.write(chunks[0])
+            self._write(stream, chunks[0])
             for c in islice(chunks, 1, None):
-                stream.flush()
-                tput.hpa(0, stdout = sys.stderr)
-                sys.stderr.flush()
-                stream.write(c)
+                self._write(sys.stderr, _tput('hpa', 0))
+                self._write(stream, c)
         if eol:
-            stream.write(eol)
-        else:
-            stream.flush()
-        sys.stderr.write('\n' * ((not eol) + dy))
+            self._write(stream, eol)
+        self._write(sys.stderr, '\n' * ((not eol) + dy))
+        self.tick()
 
 @singleton
 class LogFile:
@@ -91,6 +188,7 @@ class LogFile:
         Style.normal: 'Soaked',
         Style.abrupt: 'Failed',
     }
+    tickinterval = None
 
     def head(self, index, obj, style):
         try:
@@ -102,9 +200,27 @@ class LogFile:
     def log(self, index, stream, line):
         stream.write(line)
 
-def getterminal():
+    def tick(self):
+        pass
+
+    def flush(self):
+        pass
+
+def getterminal(viewport = None):
     try:
-        width = int(tput.cols())
-    except CalledProcessError:
+        fd = sys.stderr.fileno()
+    except (AttributeError, UnsupportedOperation):
+        return LogFile # Replaced with something that is not a file.
+    try:
+        curses.setupterm(fd = fd)
+    except curses.error:
         return LogFile
-    return Terminal(width)
+    try:
+        width = os.get_terminal_size(fd).columns
+    except OSError:
+        width = 0
+    if width <= 0:
+        width = curses.tigetnum('cols') # Negative if the capability is missing.
+    if width <= 0:
+        width = shutil.get_terminal_size().columns
+    return Terminal(width, viewport)
@@ -0,0 +1,34 @@
+# Copyright 2020 Andrzej Cichocki
+
+# This file is part of soak.
+#
+# soak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# soak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with soak.  If not, see <http://www.gnu.org/licenses/>.
+
+from .bench.phases import Phases
+from .bench.tree import generate
+from lagoon import git
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+class TestPhases(TestCase):
+
+    def test_small(self):
+        with TemporaryDirectory() as tempdir:
+            root = Path(tempdir)
+            generate(root, 2, 2, lines = 4, blocks = .5, resultsize = 200)
+            git.init._q[print](root)
+            times = Phases(root, 2, False)(1)
+            self.assertEqual(Phases.names, list(times))
+            self.assertEqual(4, sum(1 for _ in root.rglob('t*.yaml')))
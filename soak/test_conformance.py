@@ -15,36 +15,78 @@
 # You should have received a copy of the GNU General Public License
 # along with soak.  If not, see <http://www.gnu.org/licenses/>.
 
+from .discovery import gitchanges
+from .soak import Session
 from contextlib import contextmanager
 from lagoon import git, unzip
-from lagoon.program import Program
+from lagoon.program import bg, Program
 from pathlib import Path
-from shutil import copytree
+from shutil import copyfile, copytree
 from tempfile import TemporaryDirectory
 from unittest import TestCase
-import json, os, sys, yaml
+from unittest.mock import patch
+import json, os, sys, tarfile, yaml, zipfile
 
 class TestConformance(TestCase):
 
+    def _main(self, conformance, returncode, *args):
+        self.assertEqual(returncode, Program.text(sys.executable)._c[print](f"import sys\nsys.path[:] = {', '.join(repr(os.path.abspath(p)) for p in sys.path)}\nsys.argv[1:] = {args!r}\nfrom soak.soak import main\nmain()", cwd = conformance, check = False))
+
     @contextmanager
-    def _soak(self, name, returncode):
+    def _soak(self, name, returncode, *args):
         source = Path(__file__).parent / name
-        with TemporaryDirectory() as tempdir:
+        with TemporaryDirectory() as tempdir, patch.dict(os.environ, SOAK_ARTIFACTS = str(Path(tempdir, 'artifacts'))):
             conformance = Path(tempdir, name)
             # TODO LATER: Ideally do not copy git-ignored files.
             copytree(source, conformance)
             git.init[print](conformance)
-            self.assertEqual(returncode, Program.text(sys.executable)._c[print](f"import sys\nsys.path[:] = {', '.join(repr(os.path.abspath(p)) for p in sys.path)}\nfrom soak.soak import main\nmain()", cwd = conformance, check = False))
+            self._main(conformance, returncode, *args)
             yield conformance
 
     def test_works(self):
         with self._soak('conformance', 0) as conformance:
-            with (conformance / 'conf.json').open() as f:
-                self.assertEqual(dict(mydata = 'hello there'), json.load(f))
-            self.assertEqual('Bad example.', (conformance / 'readme.txt').read_text())
-            self.assertTrue(' testing: mylib.py ' in unzip._t(conformance / 'mylib.whl'))
-            infotext = (conformance / 'info.yaml').read_text()
-            self.assertEqual('''root:
+            self._checkworks(conformance)
+
+    def test_pool(self):
+        with self._soak('conformance', 0, '--pool') as conformance:
+            self._checkworks(conformance)
+        with self._soak('conformance2', 1, '--pool') as conformance2:
+            self.assertEqual('warp me\n', (conformance2 / 'bar').read_text())
+
+    def test_poolinputs(self):
+        with TemporaryDirectory() as tempdir:
+            tree = Path(tempdir)
+            plugin = tree / 'lib' / 'soakpoolplug.py'
+            plugin.parent.mkdir()
+            plugin.write_text("val = 'v1'\n")
+            (tree / 'soak.arid').write_text('myval = $pyref(soakpoolplug val)\nsoak\n    out.txt data = $(myval)\n    out2.txt data = $(myval)\n')
+            git.init[print](tree)
+            with patch('sys.path', [str(plugin.parent), *sys.path]):
+                self._main(tree, 0, '--pool', '-j', '1')
+            with (tree / '.soak-cache' / 'build.json').open() as f:
+                targets = json.load(f)['targets']
+            for target in 'out.txt', 'out2.txt':
+                self.assertIn(str(plugin), targets[target]['inputs'])
+
+    @patch.dict(os.environ, SOURCE_DATE_EPOCH = '315532800') # Reproducible wheel.
+    def test_executors(self):
+        with self._soak('conformance', 0) as conformance:
+            self._main(conformance, 0, '--output-archive', 'fork.tar', '--executor', 'fork')
+            for executor in 'thread', 'inline', 'auto':
+                self._main(conformance, 0, '--check', '--executor', executor)
+                self._main(conformance, 0, '--output-archive', f"{executor}.tar", '--executor', executor)
+                self.assertEqual((conformance / 'fork.tar').read_bytes(), (conformance / f"{executor}.tar").read_bytes())
+        with self._soak('conformance2', 1) as conformance2:
+            for executor in 'thread', 'inline':
+                self._main(conformance2, 1, '--output-archive', 'bundle.tar', '--executor', executor)
+
+    def _checkworks(self, conformance):
+        with (conformance / 'conf.json').open() as f:
+            self.assertEqual(dict(mydata = 'hello there'), json.load(f))
+        self.assertEqual('Bad example.', (conformance / 'readme.txt').read_text())
+        self.assertTrue(' testing: mylib.py ' in unzip._t(conformance / 'mylib.whl'))
+        infotext = (conformance / 'info.yaml').read_text()
+        self.assertEqual('''root:
     x:
         block: |
             first line
@@ -69,17 +111,17 @@ class TestConformance(TestCase):
          x
     linear: " "
 ''', infotext)
-            info = yaml.safe_load(infotext)
-            self.assertEqual('first line\nsecond line\n', info['root']['x']['block'])
-            self.assertEqual('1st line\n2nd line', info['root']['noeol'])
-            self.assertEqual('', info['root']['empty'])
-            self.assertEqual('w\n\n', info['root']['d']['doubleeol'])
-            self.assertEqual('\n\n', info['root']['d']['doubleeolonly'])
-            self.assertEqual('only line', info['root']['noeol1'])
-            self.assertEqual(' x\n', info['root']['indentedeol']) # TODO LATER: Also test non-space in indentunit.
-            self.assertEqual(' ', info['root']['linear'])
-            self.assertEqual('Can report relplug OK and veryrelplug OK.\n', (conformance / 'subdir' / 'verysubdir' / 'report.txt').read_text())
-            self.assertEqual('''core_eranu:
+        info = yaml.safe_load(infotext)
+        self.assertEqual('first line\nsecond line\n', info['root']['x']['block'])
+        self.assertEqual('1st line\n2nd line', info['root']['noeol'])
+        self.assertEqual('', info['root']['empty'])
+        self.assertEqual('w\n\n', info['root']['d']['doubleeol'])
+        self.assertEqual('\n\n', info['root']['d']['doubleeolonly'])
+        self.assertEqual('only line', info['root']['noeol1'])
+        self.assertEqual(' x\n', info['root']['indentedeol']) # TODO LATER: Also test non-space in indentunit.
+        self.assertEqual(' ', info['root']['linear'])
+        self.assertEqual('Can report relplug OK and veryrelplug OK.\n', (conformance / 'subdir' / 'verysubdir' / 'report.txt').read_text())
+        self.assertEqual('''core_eranu:
 core_pipeline_eranu=woo
 core_uvavu:
 core_csv_uvavu=yay
@@ -89,3 +131,126 @@ core_pipeline_uvavu=houpla
     def test_propagatefailure(self):
         with self._soak('conformance2', 1) as conformance2:
             self.assertEqual('warp me\n', (conformance2 / 'bar').read_text())
+
+    def test_incremental(self):
+        with self._soak('conformance', 0) as conformance:
+            readme = conformance / 'readme.txt'
+            mtime = readme.stat().st_mtime_ns
+            (conformance / 'conf.json').write_text('stale')
+            self._main(conformance, 0)
+            with (conformance / 'conf.json').open() as f:
+                self.assertEqual(dict(mydata = 'hello there'), json.load(f))
+            self.assertEqual(mtime, readme.stat().st_mtime_ns)
+            template = conformance / 'subdir' / 'verysubdir' / 'report.txt.aridt'
+            template.write_text(f"{template.read_text()}Again.\n")
+            self._main(conformance, 0)
+            self.assertEqual('Can report relplug OK and veryrelplug OK.\nAgain.\n', (conformance / 'subdir' / 'verysubdir' / 'report.txt').read_text())
+            self.assertEqual(mtime, readme.stat().st_mtime_ns)
+            readme.write_text('Bad example.') # Same content, new mtime.
+            mtime = readme.stat().st_mtime_ns
+            self._main(conformance, 0, '--force')
+            self.assertEqual(mtime, readme.stat().st_mtime_ns) # Rendered again but unchanged so not rewritten.
+            readme.write_text('Bad example!')
+            self._main(conformance, 0, '--force')
+            self.assertEqual('Bad example.', readme.read_text())
+
+    @patch.dict(os.environ, SOURCE_DATE_EPOCH = '315532800') # Reproducible wheel.
+    def test_check(self):
+        with self._soak('conformance', 0) as conformance:
+            self._main(conformance, 0, '--check')
+            (conformance / 'conf.json').write_text('stale')
+            self._main(conformance, 1, '--check')
+            self.assertEqual('stale', (conformance / 'conf.json').read_text())
+            (conformance / 'conf.json').unlink()
+            self._main(conformance, 1, '--check')
+            self.assertFalse((conformance / 'conf.json').exists())
+
+    def test_trace(self):
+        with self._soak('conformance', 0, '--force', '--trace', 'trace.json') as conformance:
+            with (conformance / 'trace.json').open() as f:
+                events = json.load(f)['traceEvents']
+        names = {e['name'] for e in events}
+        self.assertTrue({'discovery', 'load', 'fork', 'task', 'resolve', 'writeout'} <= names, names)
+        pid, = {e['pid'] for e in events if 'discovery' == e['name']}
+        self.assertNotIn(pid, {e['pid'] for e in events if 'writeout' == e['name']})
+
+    @patch.dict(os.environ, SOURCE_DATE_EPOCH = '315532800') # Reproducible wheel.
+    def test_archive(self):
+        with self._soak('conformance', 0, '--output-archive', 'bundle.tar') as conformance:
+            self.assertFalse((conformance / 'conf.json').exists())
+            tarbytes = (conformance / 'bundle.tar').read_bytes()
+            self._main(conformance, 0, '--output-archive', 'bundle.tar')
+            self.assertEqual(tarbytes, (conformance / 'bundle.tar').read_bytes())
+            for name in 'bundle.tgz', 'bundle.tar.gz', 'bundle.tar.xz', 'bundle.zip':
+                self._main(conformance, 0, '--output-archive', name)
+                data = (conformance / name).read_bytes()
+                self._main(conformance, 0, '--output-archive', name)
+                self.assertEqual(data, (conformance / name).read_bytes(), name)
+                if name.endswith('gz'):
+                    self.assertEqual(315532800, int.from_bytes(data[4:8], 'little')) # Not the time of the run.
+            with tarfile.open(conformance / 'bundle.tgz') as tgz, tarfile.open(conformance / 'bundle.tar') as tar:
+                self.assertEqual([tar.extractfile(m).read() for m in tar.getmembers()], [tgz.extractfile(m).read() for m in tgz.getmembers()])
+            self._main(conformance, 0, '--output-archive', 'bundle.zip')
+            self._main(conformance, 0)
+            with tarfile.open(conformance / 'bundle.tar') as tar, zipfile.ZipFile(conformance / 'bundle.zip') as z:
+                names = tar.getnames()
+                self.assertEqual(names, z.namelist())
+                self.assertIn('conf.json', names)
+                self.assertIn('subdir/verysubdir/report.txt', names)
+                for name in names:
+                    data = (conformance / name).read_bytes()
+                    self.assertEqual(data, tar.extractfile(name).read())
+                    self.assertEqual(data, z.read(name))
+                self.assertEqual({315532800}, {m.mtime for m in tar.getmembers()})
+
+    def test_select(self):
+        with self._soak('conformance', 0, 'subdir/**/*.txt', 'conf.json') as conformance:
+            self.assertEqual('Can report relplug OK and veryrelplug OK.\n', (conformance / 'subdir' / 'verysubdir' / 'report.txt').read_text())
+            self.assertTrue((conformance / 'conf.json').exists())
+            self.assertFalse((conformance / 'readme.txt').exists())
+            self._main(conformance, 0, 'readme.txt')
+            with (conformance / '.soak-cache' / 'build.json').open() as f:
+                self.assertEqual({'conf.json', 'readme.txt', 'subdir/verysubdir/report.txt'}, set(json.load(f)['targets']))
+
+    @patch.dict(os.environ, GIT_AUTHOR_NAME = 'soak', GIT_AUTHOR_EMAIL = 'soak@example.com', GIT_COMMITTER_NAME = 'soak', GIT_COMMITTER_EMAIL = 'soak@example.com')
+    def test_since(self):
+        with self._soak('conformance', 0) as conformance:
+            git.add[print]('.', cwd = conformance)
+            git.commit._qm[print]('Rendered.', cwd = conformance)
+            session = Session(conformance)
+            self.assertEqual([], list(session.touched(gitchanges(conformance, 'HEAD'))))
+            template = conformance / 'map' / 'main.tf.aridt'
+            template.write_text(f"{template.read_text()}#\n")
+            self.assertEqual({'map/main.tf', 'conf.json', 'readme.txt', 'mylib.whl', 'info.yaml'}, set(map(str, session.touched(gitchanges(conformance, 'HEAD')))))
+            report = conformance / 'subdir' / 'verysubdir' / 'report.txt'
+            report.write_text('stale')
+            git.update_index.__assume_unchanged[print](report, cwd = conformance)
+            self._main(conformance, 0, '--since', 'HEAD', '--force')
+            self.assertEqual('stale', report.read_text())
+            self.assertTrue((conformance / 'map' / 'main.tf').read_text().endswith('#\n'))
+            git.update_index.__no_assume_unchanged[print](report, cwd = conformance)
+            git.checkout[print]('.', cwd = conformance)
+            self.assertEqual([], list(session.touched(gitchanges(conformance, 'HEAD'))))
+            plugin = conformance / 'subdir' / 'veryrelplug.py'
+            plugin.write_text(plugin.read_text().replace('OK', 'fine'))
+            self.assertIn(Path('subdir', 'verysubdir', 'report.txt'), set(session.touched(gitchanges(conformance, 'HEAD'))))
+            self._main(conformance, 0, '--since', 'HEAD')
+            self.assertEqual('Can report relplug OK and veryrelplug fine.\n', report.read_text())
+
+    def test_shard(self):
+        with self._soak('conformance', 0) as conformance:
+            outputs = {p: p.read_bytes() for p in [conformance / 'conf.json', conformance / 'map' / 'main.tf', conformance / 'subdir' / 'verysubdir' / 'report.txt']}
+            for p in outputs:
+                p.unlink()
+            copyfile(conformance / '.soak-cache' / 'build.json', conformance / 'costs.json')
+            python = Program.text(sys.executable)
+            env = dict(os.environ, PYTHONPATH = os.pathsep.join(map(os.path.abspath, sys.path)))
+            shards = [python._m[bg]('soak.soak', '--shard', f"{i}/3", '--shard-manifest', f"{i}.json", '--shard-costs', 'costs.json', cwd = conformance, env = env) for i in range(1, 4)]
+            for shard in shards:
+                with shard:
+                    pass
+            for p, data in outputs.items():
+                self.assertEqual(data, p.read_bytes())
+            manifests = [f"{i}.json" for i in range(1, 4)]
+            self._main(conformance, 0, '--verify-shards', *manifests)
+            self._main(conformance, 1, '--verify-shards', *manifests[:2])
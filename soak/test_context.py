@@ -0,0 +1,37 @@
+# Copyright 2020 Andrzej Cichocki
+
+# This file is part of soak.
+#
+# soak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# soak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with soak.  If not, see <http://www.gnu.org/licenses/>.
+
+from .context import blockliteral, createparent, pyyamlblockliteral
+from aridity.model import Text
+from itertools import product
+from unittest import TestCase
+
+class TestBlockLiteral(TestCase):
+
+    def _check(self, scope, text):
+        expected = pyyamlblockliteral(scope.resolved('indent').cat(), text, lambda: scope.resolved('indentunit').cat())
+        self.assertEqual(expected, blockliteral(scope, Text(text)).cat(), repr(text))
+
+    def test_pyyamlequivalence(self):
+        scope = (-createparent('.')).scope().createchild()
+        for indent in '', '  ':
+            scope['indent',] = Text(indent)
+            for n in range(4):
+                for chars in product(['a', ' ', '\n', '\t', '#', 'é'], repeat = n):
+                    self._check(scope, ''.join(chars))
+            for text in ['first line\nsecond line\n', 'w\n\n', '\n\n', ' x\n', '1st line\n2nd line', '...\n', '---\nx', 'x \ny\n', 'a\r\nb', 'x' * 200 + ' y' * 100]:
+                self._check(scope, text)
@@ -0,0 +1,77 @@
+# Copyright 2020 Andrzej Cichocki
+
+# This file is part of soak.
+#
+# soak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# soak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with soak.  If not, see <http://www.gnu.org/licenses/>.
+
+from .diff import textdiff
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+class TestTextDiff(TestCase):
+
+    def setUp(self):
+        self.tempdir = TemporaryDirectory()
+        self.path = Path(self.tempdir.name, 'x')
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_same(self):
+        self.path.write_text('a\nb\n')
+        self.assertEqual('', textdiff('a\nb\n', self.path))
+
+    def test_changed(self):
+        self.path.write_text('a\nc\n')
+        self.assertEqual(f"""\x1b[1m--- -\x1b[m
+\x1b[1m+++ {self.path}\x1b[m
+\x1b[36m@@ -1,2 +1,2 @@\x1b[m
+ a
+\x1b[31m-b\x1b[m
+\x1b[32m+c\x1b[m
+""", textdiff('a\nb\n', self.path))
+
+    def test_missing(self):
+        self.assertEqual(f"""\x1b[1m--- -\x1b[m
+\x1b[1m+++ {self.path}\x1b[m
+\x1b[36m@@ -1 +0,0 @@\x1b[m
+\x1b[31m-a\x1b[m
+""", textdiff('a\n', self.path))
+
+    def test_noeol(self):
+        self.path.write_text('a')
+        self.assertTrue(textdiff('a\n', self.path).endswith('\x1b[32m+a\x1b[m\n\\ No newline at end of file\n'))
+
+    def test_lineseparators(self):
+        self.path.write_text('a\fb\x85c\u2028d\n', encoding = 'utf-8')
+        self.assertEqual('', textdiff('a\fb\x85c\u2028d\n', self.path))
+        self.path.write_text('a\fb\nc\n', encoding = 'utf-8')
+        self.assertEqual(f"""\x1b[1m--- -\x1b[m
+\x1b[1m+++ {self.path}\x1b[m
+\x1b[36m@@ -1,2 +1,2 @@\x1b[m
+ a\fb
+\x1b[31m-x\x1b[m
+\x1b[32m+c\x1b[m
+""", textdiff('a\fb\nx\n', self.path))
+
+    def test_crlf(self):
+        self.path.write_bytes(b'a\r\nb\n')
+        self.assertEqual(f"""\x1b[1m--- -\x1b[m
+\x1b[1m+++ {self.path}\x1b[m
+\x1b[36m@@ -1,2 +1,2 @@\x1b[m
+\x1b[31m-a\x1b[m
+\x1b[32m+a\r\x1b[m
+ b
+""", textdiff('a\nb\n', self.path))
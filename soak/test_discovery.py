@@ -0,0 +1,83 @@
+# Copyright 2020 Andrzej Cichocki
+
+# This file is part of soak.
+#
+# soak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# soak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with soak.  If not, see <http://www.gnu.org/licenses/>.
+
+from .discovery import Discovery, Selection
+from lagoon import git
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+import os
+
+class TestDiscovery(TestCase):
+
+    def setUp(self):
+        self.tempdir = TemporaryDirectory()
+        self.root = Path(self.tempdir.name)
+        for reldir in ['', 'a', 'a/b', 'node_modules/x', 'ignored', 'c']:
+            (self.root / reldir).mkdir(parents = True, exist_ok = True)
+            if 'c' != reldir:
+                (self.root / reldir / 'soak.arid').write_text('')
+        self.discovery = Discovery(self.root, 'soak.arid')
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def _expected(self, *reldirs):
+        return sorted(self.root / d / 'soak.arid' for d in reldirs)
+
+    def test_walk(self):
+        for _ in range(2): # First run creates the cache dir so changes the root mtime.
+            self.assertEqual(self._expected('', 'a', 'a/b', 'ignored'), self.discovery(False))
+        with patch('os.scandir', side_effect = AssertionError):
+            self.assertEqual(self._expected('', 'a', 'a/b', 'ignored'), self.discovery(False))
+        os.remove(self.root / 'a' / 'soak.arid')
+        (self.root / 'c' / 'soak.arid').write_text('')
+        self.assertEqual(self._expected('', 'a/b', 'c', 'ignored'), self.discovery(False))
+
+    def test_walkprune(self):
+        self.discovery(False)
+        self.assertEqual(self._expected('', 'a', 'node_modules/x'), Discovery(self.root, 'soak.arid', {'b', 'ignored'})(False))
+        self.assertEqual(self._expected('', 'a', 'a/b', 'ignored', 'node_modules/x'), Discovery(self.root, 'soak.arid', set())(False))
+
+    def test_git(self):
+        git.init[print](self.root)
+        (self.root / '.gitignore').write_text('/ignored/\n')
+        self.assertEqual(self._expected('', 'a', 'a/b'), self.discovery())
+        with patch.object(self.discovery, '_walkpaths', side_effect = AssertionError):
+            self.discovery()
+
+    def test_dirs(self):
+        self.assertEqual([self.root / d for d in ['', 'a', 'a/b', 'c', 'ignored']], self.discovery.dirs(False))
+        git.init[print](self.root)
+        (self.root / '.gitignore').write_text('/ignored/\n')
+        (self.root / 'a' / 'b' / 'e').mkdir()
+        git.add[print]('a/soak.arid', cwd = self.root) # Tracked so that a is not collapsed.
+        self.assertEqual([self.root / d for d in ['', 'a', 'a/b', 'a/b/e', 'c']], self.discovery.dirs())
+
+class TestSelection(TestCase):
+
+    def test_globs(self):
+        select = Selection(['k8s/**/values.yaml', './readme.txt', 'a/*/b'])
+        for path in 'k8s/values.yaml', 'k8s/x/y/values.yaml', 'readme.txt', 'a/x/b':
+            self.assertTrue(select(path), path)
+        for path in 'values.yaml', 'k8s/x/values.yml', 'x/readme.txt', 'a/x/y/b', 'a/b':
+            self.assertFalse(select(path), path)
+        for reldir in '.', 'k8s', 'k8s/x/y', 'a', 'a/x':
+            self.assertTrue(select.under(reldir), reldir)
+        for reldir in 'b', 'a/x/b', 'readme.txt':
+            self.assertFalse(select.under(reldir), reldir)
@@ -0,0 +1,271 @@
+# Copyright 2020 Andrzej Cichocki
+
+# This file is part of soak.
+#
+# soak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# soak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with soak.  If not, see <http://www.gnu.org/licenses/>.
+
+from .multifork import Channel, Tasks
+from collections import defaultdict
+from functools import partial
+from mmap import mmap
+from unittest import TestCase
+from unittest.mock import patch
+import os, sys, time
+
+def _echo(n):
+    for i in range(n):
+        os.write(1, f"out {n} {i}\n".encode())
+        os.write(2, f"err {n} {i}\n".encode())
+    os.write(1, f"partial {n}".encode())
+    return n * n
+
+def _say(n):
+    for i in range(n):
+        print(f"out {n}", i)
+        sys.stderr.write(f"err {n} {i}\n")
+    sys.stdout.write(f"partial {n}")
+    return n * n
+
+def _pid(n):
+    return os.getpid()
+
+def _blob(n):
+    return dict(blob = bytes(range(256)) * (n // 256), text = 'x' * n)
+
+def _spin(n):
+    end = time.process_time() + .05
+    while time.process_time() < end:
+        pass
+
+def _progress():
+    os.write(1, b'progress 10%\rprogress 100%\ncrlf\r')
+    time.sleep(.1)
+    os.write(1, b'\nend\r')
+
+def _stall():
+    os.write(1, b'partial')
+    time.sleep(1)
+
+def _fail():
+    raise KeyError('woo')
+
+def _die():
+    os._exit(3)
+
+class TestTasks(TestCase):
+
+    def _tasks(self, *callables):
+        tasks = Tasks()
+        for c in callables:
+            c.index = len(tasks)
+            tasks.append(c)
+        tasks.log = log = defaultdict(list)
+        tasks.started = lambda task: log[task.index].append('started')
+        tasks.stdout = lambda task, line: log[task.index].append(('stdout', line))
+        tasks.stderr = lambda task, line: log[task.index].append(('stderr', line))
+        tasks.stopped = lambda task, code: log[task.index].append(('stopped', code))
+        return tasks
+
+    def _attribution(self, **kwargs):
+        tasks = self._tasks(*(partial(_echo, n) for n in range(20)))
+        self.assertEqual([n * n for n in range(20)], tasks.drain(3, **kwargs))
+        for n in range(20):
+            events = tasks.log[n]
+            self.assertEqual(['started', ('stopped', 0)], [events[0], events[-1]])
+            self.assertEqual([f"out {n} {i}\n" for i in range(n)] + [f"partial {n}"], [l for s, l in events[1:-1] if 'stdout' == s])
+            self.assertEqual([f"err {n} {i}\n" for i in range(n)], [l for s, l in events[1:-1] if 'stderr' == s])
+
+    def test_fork(self):
+        self._attribution()
+
+    def test_pool(self):
+        self._attribution(pool = True)
+
+    def test_poolchunks(self):
+        self._attribution(pool = True, chunksize = 7)
+
+    def test_poolfailure(self):
+        tasks = self._tasks(partial(_echo, 1), _fail, partial(_echo, 2))
+        with self.assertRaises(KeyError) as cm:
+            tasks.drain(1, pool = True, chunksize = 3)
+        self.assertEqual(('woo',), cm.exception.args)
+        self.assertEqual([('stopped', 0), ('stopped', 1), ('stopped', 0)], [tasks.log[i][-1] for i in range(3)])
+
+    def test_pooldeath(self):
+        tasks = self._tasks(partial(_echo, 1), _die, partial(_echo, 2), partial(_echo, 3))
+        with self.assertRaises(ChildProcessError) as cm:
+            tasks.drain(1, pool = True, chunksize = 4)
+        self.assertEqual(('Exited with code 3 before reporting a result.',), cm.exception.args)
+        self.assertEqual([('stopped', 0), ('stopped', 3), ('stopped', 0), ('stopped', 0)], [tasks.log[i][-1] for i in range(4)])
+
+    def _local(self, backend):
+        tasks = self._tasks(*(partial(_say, n) for n in range(20)))
+        self.assertEqual([n * n for n in range(20)], tasks.drain(3, backend = backend))
+        for n in range(20):
+            events = tasks.log[n]
+            self.assertEqual(['started', ('stopped', 0)], [events[0], events[-1]])
+            self.assertEqual([f"out {n} {i}\n" for i in range(n)] + [f"partial {n}"], [l for s, l in events[1:-1] if 'stdout' == s])
+            self.assertEqual([f"err {n} {i}\n" for i in range(n)], [l for s, l in events[1:-1] if 'stderr' == s])
+        tasks = self._tasks(partial(_say, 1), _fail, partial(_say, 2))
+        with self.assertRaises(KeyError) as cm:
+            tasks.drain(2, backend = backend)
+        self.assertEqual(('woo',), cm.exception.args)
+        self.assertEqual([('stopped', 0), ('stopped', 1), ('stopped', 0)], [tasks.log[i][-1] for i in range(3)])
+
+    def test_thread(self):
+        self._local('thread')
+        self._measured(backend = 'thread')
+
+    def test_inline(self):
+        self._local('inline')
+        self._measured(backend = 'inline')
+        self.assertEqual([1, 3, 0, 2], self._schedule(limit = 3, backend = 'inline')[0])
+
+    def test_auto(self):
+        tasks = Tasks()
+        tasks.cost = lambda task: task
+        self.assertEqual('inline', tasks.choose([.001, .001], 4))
+        self.assertEqual('thread', tasks.choose([.001] * 10, 4))
+        self.assertEqual('fork', tasks.choose([.001, 1], 4))
+        self.assertEqual('fork', tasks.choose([.001, float('inf')], 4))
+        self.assertEqual([4], self._tasks(partial(_say, 2)).drain(1, backend = 'auto'))
+
+    def test_forkdeath(self):
+        tasks = self._tasks(partial(_echo, 1), _die)
+        with self.assertRaises(ChildProcessError):
+            tasks.drain(2)
+        self.assertEqual([('stopped', 0), ('stopped', 3)], [tasks.log[i][-1] for i in range(2)])
+
+    def _schedule(self, **kwargs):
+        tasks = self._tasks(*(partial(_echo, n) for n in [1, 3, 0, 2]))
+        order = []
+        running = [0, 0]
+        def started(task):
+            order.append(task.index)
+            running[0] += 1
+            running[1] = max(running)
+        def stopped(task, code):
+            running[0] -= 1
+        tasks.started = started
+        tasks.stopped = stopped
+        tasks.cost = lambda task: task.args[0]
+        self.assertEqual([1, 9, 0, 4], tasks.drain(**kwargs))
+        return order, running[1]
+
+    def test_longestfirst(self):
+        self.assertEqual(([1, 3, 0, 2], 1), self._schedule(limit = 1))
+        self.assertEqual(([1, 3, 0, 2], 1), self._schedule(limit = 1, pool = True, chunksize = 1))
+
+    def test_poolstripes(self):
+        tasks = self._tasks(*(partial(_pid, n) for n in [1, 4, 2, 3]))
+        tasks.cost = lambda task: task.args[0]
+        pids = tasks.drain(2, pool = True, chunksize = 2)
+        self.assertEqual(2, len(set(pids)))
+        self.assertEqual(pids[1], pids[0]) # Most with least costly.
+        self.assertEqual(pids[3], pids[2])
+
+    def test_maxload(self):
+        self.assertEqual(1, self._schedule(limit = 4, maxload = 0)[1])
+        self.assertEqual(1, self._schedule(limit = 4, pool = True, chunksize = 1, maxload = 0)[1])
+
+    def test_membudget(self):
+        with patch.object(Tasks, 'memory', lambda self, task: 60):
+            self.assertEqual(1, self._schedule(limit = 4, membudget = 100)[1])
+            self.assertEqual(1, self._schedule(limit = 4, pool = True, chunksize = 1, membudget = 100)[1])
+            self.assertEqual(3, self._schedule(limit = 3, membudget = 200)[1])
+
+    def _measured(self, **kwargs):
+        tasks = self._tasks(*(partial(_spin, n) for n in range(3)))
+        usages = {}
+        tasks.measured = lambda task, usage: usages.__setitem__(task.index, usage)
+        tasks.drain(2, **kwargs)
+        self.assertEqual([0, 1, 2], sorted(usages))
+        for usage in usages.values():
+            self.assertGreater(usage.wall, 0)
+            self.assertGreater(usage.cpu, 0)
+            self.assertGreater(usage.maxrss, 0x100000)
+
+    def test_measured(self):
+        self._measured()
+        self._measured(pool = True, chunksize = 2)
+
+    def test_sigchld(self):
+        with patch.object(os, 'pidfd_open', side_effect = OSError):
+            self._attribution()
+
+    def test_partialline(self):
+        tasks = self._tasks(_stall, partial(_echo, 1))
+        order = []
+        tasks.stopped = lambda task, code: order.append(task.index)
+        tasks.drain(2)
+        self.assertEqual([1, 0], order)
+        self.assertEqual(['started', ('stdout', 'partial')], tasks.log[0])
+
+    def test_carriagereturn(self):
+        tasks = self._tasks(_progress)
+        tasks.drain(1)
+        self.assertEqual(['started', *(('stdout', l) for l in ['progress 10%\n', 'progress 100%\n', 'crlf\n', 'end\n']), ('stopped', 0)], tasks.log[0])
+
+    def test_manyfds(self):
+        n = 400 # More than select can handle.
+        tasks = self._tasks(*(partial(_echo, 1) for _ in range(n)))
+        self.assertEqual([1] * n, tasks.drain(n))
+
+    def _throughput(self, **kwargs):
+        n = 16 << 20
+        tasks = self._tasks(*(partial(_blob, n) for _ in range(8)))
+        expected = _blob(n)
+        for result in tasks.drain(4, **kwargs):
+            self.assertIs(mmap, type(result['blob'].obj)) # Not copied out of the mapping.
+            self.assertTrue(result['blob'].readonly)
+            self.assertEqual(expected['blob'], result['blob'])
+            self.assertEqual(expected['text'], result['text'])
+
+    def test_forkthroughput(self):
+        self._throughput()
+
+    def test_poolthroughput(self):
+        self._throughput(pool = True, chunksize = 2)
+
+class TestChannel(TestCase):
+
+    def test_frames(self):
+        a, b = Channel.pair()
+        small = [1, b'woo', 'yay']
+        text = 'x' * Channel.threshold
+        a.send(small)
+        a.send(text)
+        a.send(dict(blobs = [b'a' * Channel.threshold, bytearray(b'b' * (Channel.threshold + 1))], small = small))
+        a.close()
+        self.assertEqual(small, b.get())
+        self.assertEqual(text, b.get())
+        obj = b.get()
+        self.assertEqual(small, obj['small'])
+        self.assertEqual([b'a' * Channel.threshold, b'b' * (Channel.threshold + 1)], obj['blobs'])
+        self.assertEqual([mmap, mmap], [type(b.obj) for b in obj['blobs']])
+        self.assertEqual([True, False], [b.readonly for b in obj['blobs']])
+        obj['blobs'][1][0] = ord('c')
+        self.assertEqual(b'c' + b'b' * Channel.threshold, obj['blobs'][1])
+        with self.assertRaises(EOFError):
+            b.get()
+        b.close()
+
+    def test_picklesonce(self):
+        obj = dict(blob = b'a' * Channel.threshold, small = [1, b'woo'])
+        with patch('pickle.dumps', side_effect = AssertionError):
+            a, b = Channel.pair()
+            a.send(obj) # Pickled once, not again to measure it.
+            self.assertEqual(obj, b.get())
+            a.close()
+            b.close()
@@ -0,0 +1,59 @@
+# Copyright 2020 Andrzej Cichocki
+
+# This file is part of soak.
+#
+# soak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# soak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with soak.  If not, see <http://www.gnu.org/licenses/>.
+
+from .parsecache import ParseCache
+from aridity.config import ConfigCtrl
+from aridity.model import Entry
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+import os
+
+class TestParseCache(TestCase):
+
+    def setUp(self):
+        self.tempdir = TemporaryDirectory()
+        self.root = Path(self.tempdir.name)
+        self.cache = ParseCache(self.root)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def _load(self, text):
+        ctrl = ConfigCtrl()
+        for resolvables in self.cache.commands(text):
+            ctrl.basescope.execute(Entry(resolvables))
+        return ctrl.node
+
+    def test_hit(self):
+        text = 'x = $.(a\nb)\ny\n    z = $(x) c\n'
+        self.assertEqual('a\nb c', self._load(text).y.z)
+        with patch('soak.parsecache.parse', side_effect = AssertionError):
+            self.assertEqual('a\nb c', self._load(text).y.z)
+
+    def test_warm(self):
+        paths = [self.root / f"{i}.arid" for i in range(3)]
+        for i, p in enumerate(paths):
+            p.write_text(f"x = {i}\n")
+        bad = self.root / 'bad.arid'
+        bad.write_text('x = $(\n')
+        self.cache.warm(paths + [bad], os.cpu_count(), False)
+        self.assertEqual(3, len(os.listdir(self.cache.dirpath)))
+        with patch('soak.parsecache.parse', side_effect = AssertionError):
+            for i, p in enumerate(paths):
+                self.assertEqual(i, self._load(p.read_text()).x)
@@ -0,0 +1,75 @@
+# Copyright 2020 Andrzej Cichocki
+
+# This file is part of soak.
+#
+# soak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# soak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with soak.  If not, see <http://www.gnu.org/licenses/>.
+
+from .multifork import Tasks
+from .soak import _historical, Session
+from .state import cachedirname
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+import json
+
+class TestSession(TestCase):
+
+    def setUp(self):
+        self.tempdir = TemporaryDirectory()
+        self.root = Path(self.tempdir.name)
+        (self.root / 'sub').mkdir()
+        (self.root / 'soak.arid').write_text('soak\n    a.txt\n        from = a.txt.aridt\n        n = 1\n')
+        (self.root / 'a.txt.aridt').write_text('n is $(n)\n')
+        (self.root / 'sub' / 'soak.arid').write_text('soak\n    b.txt\n        data = bee\n')
+        self.session = Session(self.root, walk = True)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_render(self):
+        self.assertEqual([Path('a.txt'), Path('sub/b.txt')], self.session.targets())
+        self.assertEqual(b'n is 1\n', self.session.render('a.txt'))
+        self.assertEqual(b'bee', self.session.render(self.root / 'sub' / 'b.txt'))
+        self.assertFalse((self.root / 'a.txt').exists())
+        with self.assertRaises(KeyError):
+            self.session.render('c.txt')
+        (self.root / 'a.txt.aridt').write_text('n = $(n)\n')
+        self.assertEqual(b'n = 1\n', self.session.render('a.txt')) # Templates are read per render.
+
+    def test_historical(self):
+        (self.root / cachedirname / 'build.json').write_text(json.dumps(dict(targets = {'a.txt': dict(duration = 2, maxrss = 123)})))
+        tasks = Tasks()
+        _historical(tasks, self.root)
+        task = lambda: None
+        task.target = Path('a.txt')
+        self.assertEqual((2, 123), (tasks.cost(task), tasks.memory(task)))
+
+    def test_rendermany(self):
+        expected = [b'bee', b'n is 1\n']
+        self.assertEqual(expected, self.session.render_many(['sub/b.txt', 'a.txt'], limit = 2))
+        with ThreadPoolExecutor(2) as executor:
+            self.assertEqual(expected, self.session.render_many(['sub/b.txt', 'a.txt'], executor))
+
+    def test_invalidate(self):
+        (self.root / 'soak.arid').write_text('soak\n    a.txt\n        from = a.txt.aridt\n        n = 2\n')
+        self.assertEqual(b'n is 1\n', self.session.render('a.txt'))
+        self.assertEqual({self.root / 'soak.arid'}, self.session.invalidate(['soak.arid']))
+        self.assertEqual(b'n is 2\n', self.session.render('a.txt'))
+        (self.root / 'sub' / 'soak.arid').unlink()
+        (self.root / 'new').mkdir()
+        (self.root / 'new' / 'soak.arid').write_text('soak\n    c.txt\n        data = sea\n')
+        self.session.invalidate([self.root / 'sub' / 'soak.arid', 'new'])
+        self.assertEqual([Path('a.txt'), Path('new/c.txt')], self.session.targets())
+        self.assertEqual(b'sea', self.session.render('new/c.txt'))
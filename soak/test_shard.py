@@ -0,0 +1,50 @@
+# Copyright 2020 Andrzej Cichocki
+
+# This file is part of soak.
+#
+# soak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# soak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with soak.  If not, see <http://www.gnu.org/licenses/>.
+
+from .shard import partition, shardspec, verify, writemanifest
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+
+class TestShard(TestCase):
+
+    def test_shardspec(self):
+        self.assertEqual((2, 3), shardspec('2/3'))
+        for text in '0/3', '4/3', '3':
+            with self.assertRaises(ValueError):
+                shardspec(text)
+
+    def test_partition(self):
+        costs = dict(a = 5, b = 4, c = 3, d = 3, e = None)
+        shards = partition(list(costs), 2, costs.get)
+        self.assertEqual([['a', 'c'], ['b', 'd', 'e']], shards)
+        self.assertEqual(shards, partition(list(reversed(costs)), 2, costs.get))
+        self.assertEqual([['a', 'd'], ['b'], ['c']], partition(list('dcba'), 3, lambda t: None))
+
+    def test_verify(self):
+        with TemporaryDirectory() as tempdir:
+            paths = [Path(tempdir, f"{i}.json") for i in range(3)]
+            writemanifest(paths[0], 1, 2, ['a', 'b'])
+            writemanifest(paths[1], 2, 2, ['c'])
+            writemanifest(paths[2], 2, 2, ['c', 'd'])
+            self.assertTrue(verify(paths[:2], ['a', 'b', 'c']))
+            with self.assertLogs('soak.shard') as cm:
+                self.assertFalse(verify(paths[:2], ['a', 'b', 'c', 'x']))
+            self.assertEqual(['ERROR:soak.shard:Not covered: x'], cm.output)
+            with self.assertLogs('soak.shard') as cm:
+                self.assertFalse(verify(paths, ['a', 'b', 'c']))
+            self.assertEqual(['ERROR:soak.shard:Expected each shard exactly once, got: [1, 2, 2]', 'ERROR:soak.shard:Covered 2 times: c', 'ERROR:soak.shard:Unexpected: d'], cm.output)
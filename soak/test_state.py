@@ -0,0 +1,88 @@
+# Copyright 2020 Andrzej Cichocki
+
+# This file is part of soak.
+#
+# soak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# soak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with soak.  If not, see <http://www.gnu.org/licenses/>.
+
+from .state import cachedirname, newrecord, openrecorder, writeifchanged
+from hashlib import sha256
+from importlib import import_module
+from importlib.util import cache_from_source
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+import os, py_compile, sys
+
+class TestWriteIfChanged(TestCase):
+
+    def setUp(self):
+        self.tempdir = TemporaryDirectory()
+        self.path = Path(self.tempdir.name, 'sub', 'x')
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def _write(self, *chunks):
+        self.assertEqual(sha256(b''.join(chunks)).hexdigest(), writeifchanged(self.path, chunks))
+        self.assertEqual(b''.join(chunks), self.path.read_bytes())
+        self.assertEqual(['x'], os.listdir(self.path.parent))
+        return self.path.stat().st_ino
+
+    def test_cases(self):
+        ino = self._write(b'abc', b'def')
+        self.assertEqual(0o666 & ~self._umask(), self.path.stat().st_mode & 0o777)
+        self.assertEqual(ino, self._write(b'ab', b'cdef'))
+        for chunks in [b'abc', b'dXf'], [b'abc'], [b'abc', b'defg'], []:
+            self.assertNotEqual(ino, self._write(*chunks))
+            ino = self.path.stat().st_ino
+
+    def test_abort(self):
+        def chunks():
+            yield b'abc'
+            raise KeyError
+        with self.assertRaises(KeyError):
+            writeifchanged(self.path, chunks())
+        self.assertEqual([], os.listdir(self.path.parent))
+
+    def _umask(self):
+        umask = os.umask(0)
+        os.umask(umask)
+        return umask
+
+class TestNewRecord(TestCase):
+
+    def test_cacheexcluded(self):
+        with TemporaryDirectory() as tempdir:
+            paths = [os.path.join(tempdir, 'a'), os.path.join(tempdir, cachedirname, 'parse', 'x'), os.path.join(tempdir, cachedirname, 'gone')]
+            os.makedirs(os.path.dirname(paths[1]))
+            for path in paths[:2]:
+                Path(path).write_text('x')
+            self.assertEqual([paths[0]], list(newrecord(paths, 'd')['inputs']))
+
+class TestOpenRecorder(TestCase):
+
+    @patch('sys.dont_write_bytecode', False)
+    def test_bytecode(self):
+        with TemporaryDirectory() as tempdir, patch('sys.path', [tempdir, *sys.path]):
+            source = os.path.join(tempdir, 'soakplugfixture.py')
+            Path(source).write_text('x = 1\n')
+            py_compile.compile(source, cache_from_source(source), doraise = True)
+            try:
+                with openrecorder() as paths:
+                    import_module('soakplugfixture')
+            finally:
+                sys.modules.pop('soakplugfixture', None)
+            self.assertIn(source, paths)
+            self.assertEqual([source], list(newrecord(paths, 'd')['inputs']))
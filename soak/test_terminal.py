@@ -0,0 +1,95 @@
+# Copyright 2020 Andrzej Cichocki
+
+# This file is part of soak.
+#
+# soak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# soak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with soak.  If not, see <http://www.gnu.org/licenses/>.
+
+from .terminal import Fenwick, getterminal, LogFile, Style, Terminal
+from io import StringIO
+from random import Random
+from unittest import TestCase
+from unittest.mock import patch
+import os
+
+class TestFenwick(TestCase):
+
+    def test_random(self):
+        r = Random(0)
+        f = Fenwick()
+        v = []
+        for _ in range(2000):
+            if not v or r.random() < .3:
+                x = r.randrange(5)
+                f.append(x)
+                v.append(x)
+            else:
+                i = r.randrange(len(v))
+                f[i] = v[i] = r.randrange(5)
+            n = r.randrange(len(v) + 1)
+            self.assertEqual(sum(v[:n]), f.prefix(n))
+            self.assertEqual(sum(v[n:]), f.suffix(n))
+        self.assertEqual(v, [f[i] for i in range(len(f))])
+
+class TestTerminal(TestCase):
+
+    def setUp(self):
+        for p in patch('soak.terminal._tput', lambda name, *params: ''), patch('sys.stderr', StringIO()), patch('sys.stdout', StringIO()):
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_viewport(self):
+        t = Terminal(80, 2)
+        for i in range(5):
+            t.head(i, i, Style.pending)
+        self.assertEqual([1, 0, 0, 0, 0, 0], t.heights.values)
+        t.head(0, 0, Style.running)
+        t.log(0, StringIO(), 'woo\n')
+        t.head(1, 1, Style.running)
+        self.assertEqual([1, 2, 1, 0, 0, 0], t.heights.values)
+        for i in range(3):
+            t.head(i, i, Style.abrupt if 1 == i else Style.normal)
+        t.head(3, 3, Style.running)
+        t.head(3, 3, Style.normal)
+        self.assertEqual([1, 0, 1, 1, 1, 0], t.heights.values)
+        self.assertEqual((1, 2), (t.collapsed, t.pending))
+
+    def test_noviewport(self):
+        t = Terminal(80)
+        for i in range(3):
+            t.head(i, i, Style.pending)
+        t.head(1, 1, Style.running)
+        t.log(1, StringIO(), 'x' * 200)
+        t.head(1, 1, Style.normal)
+        self.assertEqual([0, 1, 2, 1], t.heights.values)
+
+    def test_separators(self):
+        t = Terminal(80)
+        t.head(0, 0, Style.running)
+        for line in 'a\rb\n', 'c\fd\n', 'e\x1cf':
+            t.log(0, StringIO(), line)
+        self.assertEqual([0, 4], t.heights.values)
+
+class TestGetTerminal(TestCase):
+
+    def test_notafile(self):
+        with patch('sys.stderr', StringIO()):
+            self.assertIs(LogFile, getterminal())
+
+    @patch('curses.setupterm', lambda fd: None)
+    @patch('curses.tigetnum', lambda name: -2)
+    @patch('os.get_terminal_size', side_effect = OSError)
+    @patch.dict('os.environ', COLUMNS = '77')
+    def test_nocols(self, *args):
+        with patch('sys.stderr', open(os.devnull, 'w')) as f, f:
+            self.assertEqual(77, getterminal().width)
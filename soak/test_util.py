@@ -0,0 +1,115 @@
+# Copyright 2020 Andrzej Cichocki
+
+# This file is part of soak.
+#
+# soak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# soak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with soak.  If not, see <http://www.gnu.org/licenses/>.
+
+from .multifork import Tasks
+from .util import artifact, ArtifactStore, SharedSnapshot, sharedmemo
+from functools import partial
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+import os
+
+class TestArtifact(TestCase):
+
+    def setUp(self):
+        self.tempdir = TemporaryDirectory()
+        self.root = Path(self.tempdir.name)
+        self.store = ArtifactStore(self.root / 'store')
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_memo(self):
+        calls = []
+        src = self.root / 'src'
+        (src / 'dist').mkdir(parents = True)
+        (src / 'a').write_text('a')
+        @artifact(lambda x: [src], store = self.store)
+        def f(x):
+            calls.append(x)
+            (src / 'dist' / str(len(calls))).write_text('')
+            return (src / 'a').read_text() * x
+        self.assertEqual('aa', f(2))
+        self.assertEqual('aa', f(2))
+        self.assertEqual([2], calls)
+        (src / 'a').write_text('b')
+        self.assertEqual('bb', f(2))
+        self.assertEqual([2, 2], calls)
+
+    def test_evict(self):
+        self.store.maxsize = 250
+        for i in range(3):
+            self.store.put(str(i), bytes(100))
+        self.assertEqual(bytes(100), self.store.get('2')) # Deduplicated by content.
+        for i in range(3):
+            self.store.put(f"x{i}", bytes([i]) * 100)
+            os.utime(self.store.objectsdir / (self.store.keysdir / f"x{i}").read_text(), ns = (i, i))
+        self.store._evict()
+        self.assertIsNone(self.store.get('x0'))
+        self.assertEqual(bytes([2]) * 100, self.store.get('x2'))
+
+    def test_none(self):
+        calls = []
+        @artifact(lambda: [], store = self.store)
+        def f():
+            calls.append(None)
+        self.assertIsNone(f())
+        self.assertIsNone(f())
+        self.assertEqual([None], calls)
+
+    def test_evictrace(self):
+        for i in range(3):
+            self.store.put(f"x{i}", bytes([i]) * 100)
+        self.store.maxsize = 0
+        with os.scandir(self.store.objectsdir) as it:
+            entries = list(it)
+        for e in entries[:2]:
+            os.remove(e.path) # As if by another child.
+        with patch('os.scandir', return_value = iter(entries)):
+            self.store._evict()
+        with patch('os.remove', side_effect = FileNotFoundError):
+            self.store._evict()
+
+class TestSharedSnapshot(TestCase):
+
+    def _count(self, path, obj):
+        with path.open('a') as f:
+            f.write('x')
+        if isinstance(obj, Exception):
+            raise obj
+        return obj
+
+    def test_once(self):
+        with TemporaryDirectory() as tempdir:
+            calls = Path(tempdir, 'calls')
+            snapshot = SharedSnapshot(partial(self._count, calls, 'woo'))
+            with sharedmemo():
+                tasks = Tasks(partial(snapshot.resolve, None) for _ in range(4))
+                self.assertEqual(['woo'] * 4, tasks.drain(4))
+            self.assertEqual('x', calls.read_text())
+            snapshot = SharedSnapshot(partial(self._count, calls, KeyError('bad')))
+            with sharedmemo():
+                tasks = Tasks(partial(snapshot.resolve, None) for _ in range(4))
+                with self.assertRaises(KeyError):
+                    tasks.drain(4)
+            self.assertEqual('xx', calls.read_text())
+
+    def test_childkeys(self):
+        with patch('os.getpid', return_value = 1): # As if a later child reused the pid of an earlier one.
+            keys = Tasks(lambda: SharedSnapshot(None).key for _ in range(2)).drain(1)
+        self.assertNotEqual(*keys)
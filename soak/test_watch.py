@@ -0,0 +1,74 @@
+# Copyright 2020 Andrzej Cichocki
+
+# This file is part of soak.
+#
+# soak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# soak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with soak.  If not, see <http://www.gnu.org/licenses/>.
+
+from .watch import Inotify
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest import TestCase
+from unittest.mock import patch
+import errno, os, subprocess, sys, time
+
+class TestInotify(TestCase):
+
+    def test_changes(self):
+        with TemporaryDirectory() as tempdir, Inotify() as inotify:
+            d = Path(tempdir)
+            (d / 'sub').mkdir()
+            inotify.watch(d)
+            inotify.watch(d / 'sub')
+            inotify.watch(d / 'missing')
+            (d / 'x').write_text('x')
+            (d / 'sub' / 'y').write_text('y')
+            (d / 'x').rename(d / 'z')
+            self.assertEqual({str(d / n) for n in ['x', 'z', 'sub/y']}, inotify.changes(.05))
+            (d / 'z').unlink()
+            self.assertEqual({str(d / 'z')}, inotify.changes(.05))
+
+    def test_full(self):
+        with TemporaryDirectory() as tempdir, Inotify() as inotify, patch.object(inotify, '_check', side_effect = OSError(errno.ENOSPC, 'No space left on device')):
+            with self.assertLogs('soak.watch') as logs:
+                inotify.watch(tempdir)
+                inotify.watch(os.path.join(tempdir, 'other'))
+            self.assertEqual(1, len(logs.records))
+            self.assertEqual({}, inotify.wds)
+
+class TestWatch(TestCase):
+
+    def _await(self, path):
+        for _ in range(100):
+            if path.exists():
+                return path.read_text()
+            time.sleep(.1)
+        self.fail(path)
+
+    def test_newconfig(self):
+        with TemporaryDirectory() as tempdir:
+            root = Path(tempdir)
+            (root / 'soak.arid').write_text('soak\n    a.txt\n        data = A\n')
+            (root / 'x' / 'y').mkdir(parents = True)
+            env = dict(os.environ, PYTHONPATH = os.pathsep.join(map(os.path.abspath, sys.path)))
+            with subprocess.Popen([sys.executable, '-m', 'soak.soak', '--walk', '--watch'], cwd = root, env = env, stderr = subprocess.PIPE, text = True) as p:
+                try:
+                    self.assertEqual('A', self._await(root / 'a.txt'))
+                    (root / 'x' / 'y' / 'z').mkdir()
+                    (root / 'x' / 'y' / 'z' / 'soak.arid').write_text('soak\n    b.txt\n        data = B\n')
+                    self.assertEqual('B', self._await(root / 'x' / 'y' / 'z' / 'b.txt'))
+                    time.sleep(1)
+                finally:
+                    p.terminate()
+                log = p.stderr.read()
+        self.assertEqual(2, log.count('[INFO] Wall '), log) # No extra round due to our own cache.
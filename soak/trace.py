@@ -0,0 +1,69 @@
+# Copyright 2020 Andrzej Cichocki
+
+# This file is part of soak.
+#
+# soak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# soak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with soak.  If not, see <http://www.gnu.org/licenses/>.
+
+from contextlib import contextmanager, nullcontext
+from lagoon.util import atomic
+import cProfile, json, os, threading, time
+
+class Tracer:
+    'Collect Chrome trace events, doing nothing unless enabled.'
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+
+    def span(self, name, **args):
+        return self._span(name, args) if self.enabled else nullcontext()
+
+    @contextmanager
+    def _span(self, name, args):
+        start = time.monotonic_ns() # Same clock in every process.
+        try:
+            yield
+        finally:
+            self.events.append(dict(name = name, ph = 'X', ts = start / 1000, dur = (time.monotonic_ns() - start) / 1000, pid = os.getpid(), tid = threading.get_native_id(), args = args))
+
+    def take(self):
+        events = self.events
+        self.events = []
+        return events
+
+    def save(self, path):
+        'Write trace event JSON, or one event per line if the path ends with .jsonl.'
+        with atomic(path) as partpath, partpath.open('w') as f:
+            if '.jsonl' == path.suffix:
+                for event in self.events:
+                    print(json.dumps(event), file = f)
+            else:
+                json.dump(dict(traceEvents = self.events, displayTimeUnit = 'ms'), f)
+
+tracer = Tracer()
+
+@contextmanager
+def profiled(path):
+    'Run the body under cProfile and dump the stats to the given path, or just run it if path is None.'
+    if path is None:
+        yield
+        return
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        path.parent.mkdir(parents = True, exist_ok = True)
+        profile.dump_stats(path)
@@ -15,8 +15,21 @@
 # You should have received a copy of the GNU General Public License
 # along with soak.  If not, see <http://www.gnu.org/licenses/>.
 
+from .state import filedigest
 from aridity.model import Resolvable
+from contextlib import contextmanager
+from diapyr.util import singleton
+from fnmatch import fnmatch
+from functools import wraps
+from hashlib import sha256
+from lagoon.util import atomic
+from pathlib import Path
+from tempfile import TemporaryDirectory
 from threading import Lock
+from uuid import uuid4
+import fcntl, logging, marshal, os, pickle
+
+log = logging.getLogger(__name__)
 
 class Snapshot(Resolvable):
 
@@ -35,19 +48,22 @@ class Snapshot(Resolvable):
         self.lock = Lock()
         self.factory = factory
 
+    def _compute(self):
+        f = self.factory
+        try:
+            obj = f()
+            eornone = None
+        except Exception as e:
+            obj = None
+            eornone = e
+        return self.Result(eornone, obj)
+
     def _loadresult(self):
         with self.lock:
             try:
                 self.result
             except AttributeError:
-                f = self.factory
-                try:
-                    obj = f()
-                    eornone = None
-                except Exception as e:
-                    obj = None
-                    eornone = e
-                self.result = self.Result(eornone, obj)
+                self.result = self._compute()
 
     def resolve(self, scope):
         try:
@@ -57,6 +73,54 @@ class Snapshot(Resolvable):
             r = self.result
         return r.get()
 
+@singleton
+class sharedmemo:
+    'While active, a directory of results that forked children compute at most once between them.'
+
+    dirpath = None
+
+    @contextmanager
+    def __call__(self):
+        olddirpath = self.dirpath
+        with TemporaryDirectory() as self.dirpath:
+            try:
+                yield
+            finally:
+                self.dirpath = olddirpath
+
+    def get(self, key, compute):
+        with open(os.path.join(self.dirpath, key), 'a+b') as f:
+            fcntl.flock(f, fcntl.LOCK_EX) # Released on close.
+            f.seek(0)
+            data = f.read()
+            if data:
+                return pickle.loads(data)
+            result = compute()
+            try:
+                data = pickle.dumps(result, pickle.HIGHEST_PROTOCOL)
+            except Exception as e:
+                log.debug("Not shared: %s", e)
+            else:
+                f.write(data)
+            return result
+
+class SharedSnapshot(Snapshot):
+    'Like Snapshot but when resolved in forked children during the active sharedmemo, computed by the first one only.'
+
+    def __init__(self, factory):
+        super().__init__(factory)
+        self.key = uuid4().hex # Unique even among children, whose pids may be reused.
+
+    def _loadresult(self):
+        if sharedmemo.dirpath is None:
+            super()._loadresult()
+        else:
+            with self.lock:
+                try:
+                    self.result
+                except AttributeError:
+                    self.result = sharedmemo.get(self.key, self._compute)
+
 class PathResolvable(Resolvable):
 
     def __init__(self, *path):
@@ -64,3 +128,100 @@ class PathResolvable(Resolvable):
 
     def resolve(self, scope):
         return scope.resolved(*self.path)
+
+class ArtifactStore:
+    'Content-addressed results indexed by key, evicting the least recently used beyond maxsize bytes.'
+
+    defaultmaxsize = 1 << 30
+
+    @classmethod
+    def default(cls):
+        path = os.environ.get('SOAK_ARTIFACTS')
+        if path is None:
+            path = Path(os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache', 'soak', 'artifacts')
+        return cls(Path(path))
+
+    def __init__(self, path, maxsize = defaultmaxsize):
+        self.keysdir = path / 'keys'
+        self.objectsdir = path / 'objects'
+        self.maxsize = maxsize
+
+    def get(self, key, default = None):
+        'The object stored under key, or default if there is none.'
+        try:
+            objectpath = self.objectsdir / (self.keysdir / key).read_text()
+            with objectpath.open('rb') as f:
+                obj = pickle.load(f)
+        except FileNotFoundError:
+            return default
+        try:
+            os.utime(objectpath) # Mark as recently used.
+        except FileNotFoundError:
+            pass # Evicted by another process since we read it.
+        return obj
+
+    def put(self, key, obj):
+        data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+        digest = sha256(data).hexdigest()
+        objectpath = self.objectsdir / digest
+        if objectpath.exists():
+            os.utime(objectpath)
+        else:
+            with atomic(objectpath) as partpath:
+                partpath.write_bytes(data)
+        with atomic(self.keysdir / key) as partpath:
+            partpath.write_text(digest)
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for e in os.scandir(self.objectsdir):
+            try:
+                if e.is_file():
+                    st = e.stat()
+                    entries.append((st.st_mtime_ns, st.st_size, e.path))
+            except FileNotFoundError:
+                pass # Another process evicted it.
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.maxsize:
+                break
+            log.debug("Evict: %s", path)
+            try:
+                os.remove(path) # Any keys still pointing here will miss.
+            except FileNotFoundError:
+                pass
+            total -= size
+
+missing = object()
+defaultexclude = '.git', '__pycache__', 'build', 'dist', '*.egg-info'
+
+def _inputsdigest(paths, exclude):
+    h = sha256()
+    def update(path, relpath):
+        if path.is_dir():
+            for child in sorted(path.iterdir()):
+                if not any(fnmatch(child.name, pattern) for pattern in exclude):
+                    update(child, f"{relpath}/{child.name}")
+        else:
+            h.update(f"{relpath}\0{filedigest(path)}\0".encode())
+    for i, path in enumerate(paths):
+        update(Path(path), str(i))
+    return h.hexdigest()
+
+def artifact(inputs, exclude = defaultexclude, store = None):
+    'Memoise a plugin function on its code and the content of the files or directories that inputs returns for the same arguments, ignoring names that match exclude.'
+    def decorator(f):
+        identity = sha256(f"{f.__module__}\0{f.__qualname__}\0".encode() + marshal.dumps(f.__code__)).hexdigest()
+        @wraps(f)
+        def g(*args):
+            key = sha256(f"{identity}\0{_inputsdigest(inputs(*args), exclude)}".encode()).hexdigest()
+            s = ArtifactStore.default() if store is None else store
+            obj = s.get(key, missing)
+            if obj is missing:
+                obj = f(*args)
+                s.put(key, obj)
+            return obj
+        return g
+    return decorator
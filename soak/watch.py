@@ -0,0 +1,110 @@
+# Copyright 2020 Andrzej Cichocki
+
+# This file is part of soak.
+#
+# soak is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# soak is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with soak.  If not, see <http://www.gnu.org/licenses/>.
+
+from select import select
+import ctypes, errno, logging, os, struct
+
+log = logging.getLogger(__name__)
+IN_MODIFY = 0x2
+IN_CLOSE_WRITE = 0x8
+IN_MOVED_FROM = 0x40
+IN_MOVED_TO = 0x80
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_IGNORED = 0x8000
+IN_ONLYDIR = 0x1000000
+mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_ONLYDIR
+eventheader = struct.Struct('iIII')
+
+class Overflow(Exception): pass
+
+class Inotify:
+    'Report changed paths in a set of watched directories.'
+
+    bufsize = 0x10000
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(None, use_errno = True)
+        self.fd = self._check(self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC))
+        self.dirs = {}
+        self.wds = {}
+        self.full = False
+
+    def _check(self, value):
+        if -1 == value:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        return value
+
+    def fileno(self):
+        return self.fd
+
+    def watch(self, dirpath):
+        dirpath = os.path.abspath(dirpath)
+        if dirpath not in self.wds:
+            try:
+                wd = self._check(self.libc.inotify_add_watch(self.fd, os.fsencode(dirpath), mask))
+            except OSError as e:
+                if errno.ENOSPC == e.errno:
+                    if not self.full:
+                        log.warning("Not watching %s and possibly others, raise fs.inotify.max_user_watches to watch more: %s", dirpath, e)
+                        self.full = True
+                    return
+                if e.errno not in {errno.ENOENT, errno.ENOTDIR}:
+                    raise
+                log.debug("Not watching: %s", dirpath)
+                return
+            self.dirs[wd] = dirpath
+            self.wds[dirpath] = wd
+
+    def _read(self, paths):
+        try:
+            data = os.read(self.fd, self.bufsize)
+        except BlockingIOError:
+            return
+        i = 0
+        while i < len(data):
+            wd, m, _, n = eventheader.unpack_from(data, i)
+            i += eventheader.size
+            name = os.fsdecode(data[i:i + n].rstrip(b'\0'))
+            i += n
+            if m & IN_Q_OVERFLOW:
+                raise Overflow
+            if m & IN_IGNORED:
+                self.wds.pop(self.dirs.pop(wd, None), None)
+            elif wd in self.dirs and name:
+                paths.add(os.path.join(self.dirs[wd], name))
+
+    def changes(self, debounce):
+        'Block until something changes, then collect further events until none arrive for debounce seconds.'
+        paths = set()
+        while not paths:
+            select([self], [], [])
+            self._read(paths)
+        while select([self], [], [], debounce)[0]:
+            self._read(paths)
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()